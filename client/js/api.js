@@ -315,6 +315,38 @@ class APIService {
         });
     }
 
+    /**
+     * Apply JSON Patch operations to an estimate's data
+     */
+    async patchEstimate(estimateId, operations) {
+        return await this.request(`/estimates/${estimateId}`, {
+            method: 'PATCH',
+            requiresAuth: true,
+            body: JSON.stringify(operations)
+        });
+    }
+
+    /**
+     * Download an estimate's bill of quantities (pdf, csv or xlsx)
+     */
+    async downloadEstimateReport(estimateId, format = 'pdf') {
+        const response = await fetch(`${API_BASE_URL}/estimates/${estimateId}/report?format=${format}`, {
+            headers: this.getHeaders(true)
+        });
+
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || 'An error occurred');
+        }
+
+        const url = URL.createObjectURL(await response.blob());
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = `estimate-${estimateId}.${format}`;
+        link.click();
+        URL.revokeObjectURL(url);
+    }
+
     /**
      * Delete estimate
      */
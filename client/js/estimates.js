@@ -65,6 +65,18 @@ async function deleteEstimate(estimateId) {
     }
 }
 
+// ===================================
+// DOWNLOAD REPORT
+// ===================================
+
+async function downloadEstimateReport(estimateId, format) {
+    try {
+        await api.downloadEstimateReport(estimateId, format);
+    } catch (error) {
+        showToast(error.message || 'Failed to download report');
+    }
+}
+
 // ===================================
 // SHOW ESTIMATES MODAL
 // ===================================
@@ -112,6 +124,12 @@ async function showEstimatesModal() {
                     <button class="btn btn-sm btn-secondary" onclick="loadEstimateDetails(${estimate.id})">
                         <i class="fas fa-eye"></i> View
                     </button>
+                    <button class="btn btn-sm btn-secondary" onclick="downloadEstimateReport(${estimate.id}, 'pdf')">
+                        <i class="fas fa-file-pdf"></i> PDF
+                    </button>
+                    <button class="btn btn-sm btn-secondary" onclick="downloadEstimateReport(${estimate.id}, 'xlsx')">
+                        <i class="fas fa-file-excel"></i> Excel
+                    </button>
                     <button class="btn btn-sm btn-primary" onclick="deleteEstimate(${estimate.id})">
                         <i class="fas fa-trash"></i> Delete
                     </button>
@@ -165,7 +183,8 @@ async function saveFromCalculator(calculatorType, data) {
         material_quality: data.quality || 'standard',
         total_cost: data.total_cost || 0,
         cost_per_sqft: data.cost_per_sqft || 0,
-        estimate_data: JSON.stringify(data)
+        pricing_snapshot_id: data.pricing_snapshot_id,
+        estimate_data: data
     };
 
     await saveEstimate(estimateData);
@@ -175,6 +194,7 @@ async function saveFromCalculator(calculatorType, data) {
 window.saveEstimate = saveEstimate;
 window.loadEstimates = loadEstimates;
 window.deleteEstimate = deleteEstimate;
+window.downloadEstimateReport = downloadEstimateReport;
 window.showEstimatesModal = showEstimatesModal;
 window.loadEstimateDetails = loadEstimateDetails;
 window.saveFromCalculator = saveFromCalculator;
@@ -15,7 +15,7 @@ import sys
 # Add server directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'server'))
 
-from database import Database
+from database import db
 
 def main():
     print("=" * 60)
@@ -50,7 +50,6 @@ def main():
     
     try:
         print("Initializing database...")
-        db = Database()
         db.init_db()
         print()
         print("=" * 60)
@@ -4,11 +4,14 @@ from flask_jwt_extended import JWTManager, create_access_token, jwt_required, ge
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
-from database import Database
+from database import db
+from query_stats import query_stats
 from routes.auth import auth_bp
 from routes.pricing import pricing_bp
 from routes.calculators import calculators_bp
 from routes.estimates import estimates_bp
+from routes.analytics import analytics_bp
+from routes.jobs import jobs_bp
 
 # Load environment variables
 load_dotenv()
@@ -32,14 +35,19 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 # Initialize JWT
 jwt = JWTManager(app)
 
-# Initialize Database
-db = Database()
+# Read-your-writes: after a client writes, its reads stay on the primary briefly
+db.init_app(app)
+
+# Per-request query count and DB time headers
+query_stats.init_app(app)
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(pricing_bp, url_prefix='/api/pricing')
 app.register_blueprint(calculators_bp, url_prefix='/api/calculators')
 app.register_blueprint(estimates_bp, url_prefix='/api/estimates')
+app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
 
 # Serve frontend
 @app.route('/')
@@ -62,6 +70,16 @@ def health_check():
         'message': 'Construction Cost Estimation API is running'
     }), 200
 
+# Database connection pool statistics
+@app.route('/api/health/database', methods=['GET'])
+def database_health():
+    return jsonify({'pool': db.pool_stats()}), 200
+
+# Query latency statistics, per-endpoint DB time and slow query log
+@app.route('/api/health/queries', methods=['GET'])
+def query_health():
+    return jsonify(query_stats.snapshot()), 200
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
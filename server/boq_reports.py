@@ -0,0 +1,527 @@
+import csv
+import io
+import os
+import re
+import tempfile
+import threading
+import zipfile
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# Bump when the report layout changes, so cached reports are re-rendered
+REPORT_LAYOUT_VERSION = 1
+
+REPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf'
+}
+
+# Rendered reports are kept on disk, shared by the worker processes
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'construction_reports'))
+REPORT_CACHE_MAX_MB = int(os.getenv('REPORT_CACHE_MAX_MB', 512))
+
+# Rows rendered before a chunk is handed to the client
+ROWS_PER_CHUNK = 100
+
+MATERIAL_COLUMNS = ('Material', 'Quantity', 'Unit', 'Rate', 'Cost')
+LABOR_COLUMNS = ('Labor', 'Days', 'Rate', 'Cost')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def report_rows(estimate):
+    """Yield the rows of an estimate's bill of quantities
+
+    estimate is an estimates row with decoded estimate_data. Rows are
+    (kind, values) with kind one of 'title', 'field' (label, value),
+    'section' (title, column names), 'item' (cells) and 'total'
+    (label, value); renderers only decide how each kind looks.
+    """
+    data = estimate.get('estimate_data')
+    data = data if isinstance(data, dict) else {}
+    created_at = estimate.get('created_at')
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%d-%m-%Y')
+
+    yield 'title', ('Construction Cost Estimate',)
+    yield 'field', ('Project', estimate.get('project_name') or 'Untitled Project')
+    yield 'field', ('Date', str(created_at or ''))
+    if estimate.get('plot_length') and estimate.get('plot_breadth'):
+        yield 'field', ('Plot (ft)', f"{estimate['plot_length']} x {estimate['plot_breadth']}")
+    yield 'field', ('Floors', estimate.get('num_floors'))
+    yield 'field', ('Built-up area (sq.ft)', estimate.get('total_area'))
+    yield 'field', ('Quality', estimate.get('material_quality') or data.get('quality') or 'standard')
+    if estimate.get('pricing_snapshot_id'):
+        yield 'field', ('Pricing snapshot', estimate['pricing_snapshot_id'][:12])
+
+    materials = [item for item in data.get('material_breakdown') or [] if isinstance(item, dict)]
+    if materials:
+        yield 'section', ('Materials', MATERIAL_COLUMNS)
+        for item in materials:
+            yield 'item', (item.get('material'), item.get('quantity'), item.get('unit'),
+                           item.get('rate'), item.get('cost'))
+
+    labor = [item for item in data.get('labor_breakdown') or [] if isinstance(item, dict)]
+    if labor:
+        yield 'section', ('Labor', LABOR_COLUMNS)
+        for item in labor:
+            yield 'item', (item.get('labor_type'), item.get('days'), item.get('rate'), item.get('cost'))
+
+    yield 'section', ('Summary', ())
+    if data.get('total_material_cost') is not None:
+        yield 'total', ('Material cost', data['total_material_cost'])
+    if data.get('total_labor_cost') is not None:
+        yield 'total', ('Labor cost', data['total_labor_cost'])
+    yield 'total', ('Total cost', estimate.get('total_cost'))
+    yield 'total', ('Cost per sq.ft', estimate.get('cost_per_sqft'))
+
+
+def render_csv(rows):
+    """Render report rows as CSV, yielding bytes chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for count, (kind, values) in enumerate(rows, start=1):
+        if kind == 'section':
+            writer.writerow([])
+            writer.writerow([values[0]])
+            if values[1]:
+                writer.writerow(values[1])
+        else:
+            writer.writerow(['' if value is None else value for value in values])
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file collecting written bytes until they are drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="BOQ" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Style 0 is plain, style 1 bold
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    )
+}
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values, bold=False):
+    cells = []
+    style = ' s="1"' if bold else ''
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        ref = f'{_column_letter(i)}{number}'
+        if _is_number(value):
+            cells.append(f'<c r="{ref}"{style}><v>{value}</v></c>')
+        else:
+            text = escape(_XML_INVALID.sub('', str(value)))
+            cells.append(f'<c r="{ref}"{style} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def render_xlsx(rows):
+    """Render report rows as a single-sheet XLSX workbook, yielding bytes chunks
+
+    The sheet is written row by row into a deflated zip entry on an
+    unseekable sink, so the workbook never has to fit in memory.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_STATIC.items():
+            workbook.writestr(name, content)
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<cols><col min="1" max="1" width="32" customWidth="1"/>'
+                '<col min="2" max="5" width="14" customWidth="1"/></cols><sheetData>'
+            ).encode('utf-8'))
+
+            number = 0
+            for count, (kind, values) in enumerate(rows, start=1):
+                lines = []
+                if kind == 'section':
+                    number += 2
+                    lines.append(_xlsx_row(number, (values[0],), bold=True))
+                    if values[1]:
+                        number += 1
+                        lines.append(_xlsx_row(number, values[1], bold=True))
+                else:
+                    number += 1
+                    lines.append(_xlsx_row(number, values, bold=kind in ('title', 'total')))
+                sheet.write(''.join(lines).encode('utf-8'))
+                if count % ROWS_PER_CHUNK == 0:
+                    yield sink.drain()
+
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+# Helvetica advance widths (1/1000 em) for the characters in numbers;
+# other characters are estimated at the width of a digit
+_HELVETICA_WIDTHS = {',': 278, '.': 278, ' ': 278, '-': 333, 'x': 500}
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+PAGE_MARGIN = 50
+
+
+def _text_width(text, size):
+    return sum(_HELVETICA_WIDTHS.get(char, 556) for char in text) * size / 1000
+
+
+def _pdf_text(value):
+    if value is None:
+        return ''
+    if _is_number(value):
+        return f'{value:,.2f}' if isinstance(value, (float, Decimal)) else f'{value:,}'
+    return str(value).replace('₹', 'Rs.')
+
+
+def _pdf_escape(text):
+    text = text.encode('cp1252', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+class _PdfPage:
+    """Content stream of one page, filled from the top down"""
+
+    def __init__(self, number):
+        self.ops = []
+        self.y = PAGE_HEIGHT - PAGE_MARGIN
+        self.number = number
+
+    def text(self, x, text, size, bold=False, align='left', color=None):
+        if align == 'right':
+            x -= _text_width(text, size)
+        if color:
+            self.ops.append(f'{color[0]} {color[1]} {color[2]} rg')
+        self.ops.append(f'BT /{"F2" if bold else "F1"} {size} Tf {x:.2f} {self.y:.2f} Td ({_pdf_escape(text)}) Tj ET')
+        if color:
+            self.ops.append('0 0 0 rg')
+
+    def content(self):
+        self.y = PAGE_MARGIN / 2
+        self.text(PAGE_WIDTH - PAGE_MARGIN, f'Page {self.number}', 8, align='right')
+        return zlib.compress('\n'.join(self.ops).encode('latin-1'))
+
+
+def _column_layout(count):
+    """Left and right edge of each table column; the first is wider"""
+    width = PAGE_WIDTH - 2 * PAGE_MARGIN
+    first = width * 0.36
+    rest = (width - first) / max(count - 1, 1)
+    edges = [(PAGE_MARGIN, PAGE_MARGIN + first)]
+    for i in range(count - 1):
+        left = PAGE_MARGIN + first + i * rest
+        edges.append((left, left + rest))
+    return edges
+
+
+def _fit(text, width, size):
+    if _text_width(text, size) <= width:
+        return text
+    while text and _text_width(text + '...', size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def render_pdf(rows):
+    """Render report rows as an A4 PDF, yielding bytes chunks
+
+    Each page is written out as soon as it is full; the page tree and
+    cross-reference table, which only need object offsets, come last.
+    Table headers repeat at the top of continued pages.
+    """
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def obj(number, body):
+        nonlocal position
+        offsets[number] = position
+        data = f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n'
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header + b''.join([
+        obj(1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+        obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'),
+        obj(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>'),
+    ])
+    next_id = 5
+
+    def finish(page):
+        nonlocal next_id
+        stream = page.content()
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+        return obj(content_id, f'<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n'.encode('latin-1')
+                   + stream + b'\nendstream') + obj(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode('latin-1'))
+
+    page = _PdfPage(1)
+    columns = ()
+
+    def table_header(page):
+        # Text columns (the first, and units) are left aligned, numbers right aligned
+        for i, ((left, right), name) in enumerate(zip(_column_layout(len(columns)), columns)):
+            if i == 0 or name == 'Unit':
+                page.text(left, name, 9, bold=True)
+            else:
+                page.text(right - 6, name, 9, bold=True, align='right')
+        page.y -= 14
+
+    for kind, values in rows:
+        if kind == 'section':
+            height = 40 if values[1] else 26
+        else:
+            height = {'title': 30, 'field': 14, 'item': 13, 'total': 16}[kind]
+        if page.y - height < PAGE_MARGIN:
+            yield finish(page)
+            page = _PdfPage(page.number + 1)
+            if kind == 'item' and columns:
+                table_header(page)
+
+        if kind == 'title':
+            page.text((PAGE_WIDTH - _text_width(values[0], 18)) / 2, values[0], 18, bold=True,
+                      color=(1, 0.55, 0))
+            page.y -= 30
+        elif kind == 'field':
+            page.text(PAGE_MARGIN, _pdf_text(values[0]), 10, bold=True)
+            page.text(PAGE_MARGIN + 160, _pdf_text(values[1]), 10)
+            page.y -= 14
+        elif kind == 'section':
+            page.y -= 12
+            page.text(PAGE_MARGIN, values[0], 13, bold=True, color=(1, 0.55, 0))
+            page.y -= 16
+            columns = values[1]
+            if columns:
+                table_header(page)
+        elif kind == 'item':
+            for (left, right), value in zip(_column_layout(len(values)), values):
+                text = _fit(_pdf_text(value), right - left - 6, 9)
+                if _is_number(value):
+                    page.text(right - 6, text, 9, align='right')
+                else:
+                    page.text(left, text, 9)
+            page.y -= 13
+        elif kind == 'total':
+            page.text(PAGE_MARGIN, _pdf_text(values[0]), 11, bold=True)
+            page.text(PAGE_WIDTH - PAGE_MARGIN, _pdf_text(values[1]), 11, bold=True, align='right')
+            page.y -= 16
+
+    tail = finish(page) + obj(2, (
+        f'<< /Type /Pages /Kids [{" ".join(f"{i} 0 R" for i in page_ids)}] /Count {len(page_ids)} >>'
+    ).encode('latin-1'))
+    xref_at = position
+    xref = [f'xref\n0 {next_id}\n', '0000000000 65535 f \n']
+    xref.extend(f'{offsets[i]:010d} 00000 n \n' for i in range(1, next_id))
+    xref.append(f'trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n')
+    yield tail + ''.join(xref).encode('latin-1')
+
+
+RENDERERS = {'csv': render_csv, 'xlsx': render_xlsx, 'pdf': render_pdf}
+
+
+def render_report(estimate, fmt):
+    """Render an estimate's bill of quantities, yielding bytes chunks"""
+    return RENDERERS[fmt](report_rows(estimate))
+
+
+class ReportCache:
+    """Rendered reports on disk, keyed by estimate id and change marker.
+
+    A report is streamed to the client and into a temporary file at the
+    same time, and only renamed into place once complete, so concurrent
+    workers never serve a partial file. Storing a new version of an
+    estimate's report removes the old ones, and the least recently used
+    reports are evicted above REPORT_CACHE_MAX_MB.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(estimate_id, marker):
+        return f'{estimate_id}-{marker}-v{REPORT_LAYOUT_VERSION}'
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, f'{key}.{fmt}')
+
+    def get(self, key, fmt):
+        """Get the path of a cached report, or None"""
+        path = self._path(key, fmt)
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, key, fmt, chunks):
+        """Pass chunks through while writing them to the cache"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temp_path, self._path(key, fmt))
+            complete = True
+            with self._lock:
+                self.stored += 1
+            self._remove_stale(key, fmt)
+            self._evict()
+        finally:
+            if not complete:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _remove_stale(self, key, fmt):
+        estimate_prefix = key.split('-', 1)[0] + '-'
+        for name in os.listdir(self.directory):
+            if name.startswith(estimate_prefix) and name.endswith(f'.{fmt}') and name != f'{key}.{fmt}':
+                self._remove(os.path.join(self.directory, name))
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evicted += 1
+
+    def stats(self):
+        """Get hit and eviction counters for monitoring"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stored': self.stored,
+                'evicted': self.evicted
+            }
+
+
+# Create a global report cache
+report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,198 @@
+from array import array
+import numpy as np
+
+
+class CostPlan:
+    """Construction cost coefficients for one quality level.
+
+    Consumption ratios are joined to material prices once, when the plan is
+    compiled, into flat arrays. Estimating a building is then a
+    multiply-accumulate over its total area.
+    """
+
+    def __init__(self, quality, materials, units, ratios, rates, labor_types, labor_rates):
+        self.quality = quality
+        self.materials = tuple(materials)
+        self.units = tuple(units)
+        self.ratios = array('d', ratios)
+        self.rates = array('d', rates)
+        self.cost_coefficients = array('d', (r * p for r, p in zip(self.ratios, self.rates)))
+        self.material_cost_per_sqft = sum(self.cost_coefficients)
+        self.labor_types = tuple(labor_types)
+        self.labor_rates = array('d', labor_rates)
+        self.labor_rate_total = sum(self.labor_rates)
+
+        # Zero-copy NumPy views of the coefficient arrays for batch evaluation
+        self.ratio_vector = np.frombuffer(self.ratios, dtype=np.float64)
+        self.cost_vector = np.frombuffer(self.cost_coefficients, dtype=np.float64)
+        self.labor_vector = np.frombuffer(self.labor_rates, dtype=np.float64)
+
+    @classmethod
+    def compile(cls, snapshot, quality):
+        """Build a plan from a pricing catalog snapshot"""
+        # First price row per material wins, as with the old linear scan
+        prices = {}
+        for material in snapshot.materials_for(quality):
+            prices.setdefault(material['material_name'], material)
+
+        materials, units, ratios, rates = [], [], [], []
+        for ratio in snapshot.consumption_ratios:
+            price = prices.get(ratio['material_name'])
+            if price is None:
+                continue
+            materials.append(ratio['material_name'])
+            units.append(ratio['unit'])
+            ratios.append(float(ratio['ratio_per_sqft']))
+            rates.append(float(price['price']))
+
+        labor_types = [labor['labor_type'] for labor in snapshot.labor_rates]
+        labor_rates = [float(labor['rate']) for labor in snapshot.labor_rates]
+
+        return cls(quality, materials, units, ratios, rates, labor_types, labor_rates)
+
+    @staticmethod
+    def labor_days(total_area):
+        """Estimate labor days per trade (rough estimate: 1 worker per 100 sqft)"""
+        return max(1, int(total_area / 100))
+
+    @staticmethod
+    def labor_days_vector(total_areas):
+        """Vectorized labor_days for an array of areas"""
+        return np.maximum(1, np.trunc(total_areas / 100)).astype(np.int64)
+
+    def estimate(self, plot_area, num_floors):
+        """Calculate the cost breakdown for a building"""
+        total_area = plot_area * num_floors
+
+        material_breakdown = []
+        for i, material in enumerate(self.materials):
+            material_breakdown.append({
+                'material': material,
+                'quantity': round(self.ratios[i] * total_area, 2),
+                'unit': self.units[i],
+                'rate': self.rates[i],
+                'cost': round(self.cost_coefficients[i] * total_area, 2)
+            })
+        total_material_cost = self.material_cost_per_sqft * total_area
+
+        days = self.labor_days(total_area)
+        labor_breakdown = []
+        for labor_type, rate in zip(self.labor_types, self.labor_rates):
+            labor_breakdown.append({
+                'labor_type': labor_type,
+                'days': days,
+                'rate': rate,
+                'cost': round(days * rate, 2)
+            })
+        total_labor_cost = days * self.labor_rate_total
+
+        total_cost = total_material_cost + total_labor_cost
+        cost_per_sqft = total_cost / total_area if total_area > 0 else 0
+
+        return {
+            'plot_area': round(plot_area, 2),
+            'total_area': round(total_area, 2),
+            'num_floors': num_floors,
+            'quality': self.quality,
+            'material_breakdown': material_breakdown,
+            'labor_breakdown': labor_breakdown,
+            'total_material_cost': round(total_material_cost, 2),
+            'total_labor_cost': round(total_labor_cost, 2),
+            'total_cost': round(total_cost, 2),
+            'cost_per_sqft': round(cost_per_sqft, 2)
+        }
+
+    def evaluate(self, plot_areas, num_floors):
+        """Calculate costs for many buildings at once.
+
+        Takes equal-length sequences of plot areas and floor counts and
+        returns a dict of NumPy arrays, one row per building.
+        """
+        plot_areas = np.asarray(plot_areas, dtype=np.float64)
+        total_areas = plot_areas * np.asarray(num_floors, dtype=np.float64)
+
+        days = self.labor_days_vector(total_areas)
+        total_material_cost = total_areas * self.material_cost_per_sqft
+        total_labor_cost = days * self.labor_rate_total
+        total_cost = total_material_cost + total_labor_cost
+
+        return {
+            'plot_area': plot_areas,
+            'total_area': total_areas,
+            'material_quantities': np.outer(total_areas, self.ratio_vector),
+            'material_costs': np.outer(total_areas, self.cost_vector),
+            'labor_days': days,
+            'labor_costs': np.outer(days, self.labor_vector),
+            'total_material_cost': total_material_cost,
+            'total_labor_cost': total_labor_cost,
+            'total_cost': total_cost,
+            'cost_per_sqft': np.divide(total_cost, total_areas,
+                                       out=np.zeros_like(total_cost), where=total_areas > 0)
+        }
+
+    def estimate_batch(self, plot_areas, num_floors, totals_only=False):
+        """Calculate cost breakdowns for many buildings, in estimate() shape"""
+        num_floors = [int(n) for n in num_floors]
+        result = self.evaluate(plot_areas, num_floors)
+
+        # Round with Python's round() so results match estimate() exactly
+        columns = {
+            key: _round_values(result[key])
+            for key in ('plot_area', 'total_area', 'total_material_cost',
+                        'total_labor_cost', 'total_cost', 'cost_per_sqft')
+        }
+
+        if not totals_only:
+            quantities = _round_values(result['material_quantities'])
+            material_costs = _round_values(result['material_costs'])
+            labor_days = result['labor_days'].tolist()
+            labor_costs = _round_values(result['labor_costs'])
+            rates = self.rates.tolist()
+            labor_rates = self.labor_rates.tolist()
+
+        estimates = []
+        for i, floors in enumerate(num_floors):
+            estimate = {
+                'plot_area': columns['plot_area'][i],
+                'total_area': columns['total_area'][i],
+                'num_floors': floors,
+                'quality': self.quality
+            }
+
+            if not totals_only:
+                estimate['material_breakdown'] = [
+                    {
+                        'material': material,
+                        'quantity': quantity,
+                        'unit': unit,
+                        'rate': rate,
+                        'cost': cost
+                    }
+                    for material, unit, rate, quantity, cost in zip(
+                        self.materials, self.units, rates, quantities[i], material_costs[i]
+                    )
+                ]
+                estimate['labor_breakdown'] = [
+                    {
+                        'labor_type': labor_type,
+                        'days': labor_days[i],
+                        'rate': rate,
+                        'cost': cost
+                    }
+                    for labor_type, rate, cost in zip(self.labor_types, labor_rates, labor_costs[i])
+                ]
+
+            estimate['total_material_cost'] = columns['total_material_cost'][i]
+            estimate['total_labor_cost'] = columns['total_labor_cost'][i]
+            estimate['total_cost'] = columns['total_cost'][i]
+            estimate['cost_per_sqft'] = columns['cost_per_sqft'][i]
+            estimates.append(estimate)
+
+        return estimates
+
+
+def _round_values(values):
+    """Convert a 1-D or 2-D array to nested lists of floats rounded to 2 places"""
+    if values.ndim == 1:
+        return [round(value, 2) for value in values.tolist()]
+    return [[round(value, 2) for value in row] for row in values.tolist()]
@@ -0,0 +1,258 @@
+import math
+import os
+from datetime import datetime
+from database import db
+
+# Width of a cost_per_sqft histogram bucket: each bucket's upper bound is
+# this factor times its lower bound, so percentiles are within about half
+# of it (1% at the default). Changing it requires a rebuild.
+ROLLUP_BUCKET_GROWTH = float(os.getenv('ROLLUP_BUCKET_GROWTH', 1.02))
+
+# Dimensions the rollups are kept by, and that summaries can group by
+DIMENSIONS = ('month', 'material_quality', 'num_floors')
+
+# Percentiles reported when the caller doesn't ask for others
+DEFAULT_PERCENTILES = (25, 50, 75, 90)
+
+
+def _month(created_at):
+    if isinstance(created_at, datetime):
+        return created_at.strftime('%Y-%m')
+    return str(created_at)[:7]
+
+
+def rollup_key(row):
+    """Get the (month, material_quality, num_floors) rollup of an estimate row"""
+    return (_month(row['created_at']), row['material_quality'] or 'standard', row['num_floors'] or 0)
+
+
+def bucket_for(cost_per_sqft):
+    """Get the histogram bucket of a cost_per_sqft value"""
+    return int(math.floor(math.log(max(float(cost_per_sqft), 1.0)) / math.log(ROLLUP_BUCKET_GROWTH)))
+
+
+def bucket_value(bucket, fraction=0.5):
+    """Get the value at a fraction of the way through a histogram bucket"""
+    return ROLLUP_BUCKET_GROWTH ** (bucket + fraction)
+
+
+class RollupDelta:
+    """Changes to the rollups, summed per group and bucket before writing"""
+
+    def __init__(self):
+        self.groups = {}
+        self.buckets = {}
+
+    def add(self, row, sign=1):
+        """Count an estimate row in (sign 1) or out (sign -1)
+
+        Rows need created_at, material_quality, num_floors and
+        cost_per_sqft; rows without a cost_per_sqft aren't counted.
+        """
+        if row['cost_per_sqft'] is None:
+            return
+        key = rollup_key(row)
+        value = float(row['cost_per_sqft'])
+        count, total, squares = self.groups.get(key, (0, 0.0, 0.0))
+        self.groups[key] = (count + sign, total + sign * value, squares + sign * value * value)
+        bucket_key = key + (bucket_for(value),)
+        self.buckets[bucket_key] = self.buckets.get(bucket_key, 0) + sign
+
+    def group_rows(self):
+        return [key + (count, round(total, 2), round(squares, 4))
+                for key, (count, total, squares) in self.groups.items() if count or total]
+
+    def bucket_rows(self):
+        return [key + (count,) for key, count in self.buckets.items() if count]
+
+    def write(self, tx):
+        """Add the changes to the rollup tables"""
+        for row in self.group_rows():
+            tx.execute(
+                """INSERT INTO estimate_rollups
+                (month, material_quality, num_floors, estimate_count, cost_per_sqft_sum, cost_per_sqft_sq_sum)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE estimate_count = estimate_count + VALUES(estimate_count),
+                cost_per_sqft_sum = cost_per_sqft_sum + VALUES(cost_per_sqft_sum),
+                cost_per_sqft_sq_sum = cost_per_sqft_sq_sum + VALUES(cost_per_sqft_sq_sum)""",
+                row
+            )
+        for row in self.bucket_rows():
+            tx.execute(
+                """INSERT INTO estimate_rollup_buckets
+                (month, material_quality, num_floors, bucket, estimate_count)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE estimate_count = estimate_count + VALUES(estimate_count)""",
+                row
+            )
+
+
+class CostRollups:
+    """cost_per_sqft aggregates by month, quality and floor count.
+
+    estimate_rollups keeps the count, sum and sum of squares of each
+    (month, material_quality, num_floors) group, and estimate_rollup_buckets
+    a log-scale histogram for percentiles. Both are updated in the same
+    transaction as the estimate rows, so a summary reads a few hundred
+    rollup rows whatever the number of estimates.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def apply(self, tx, changes):
+        """Add rows to (sign 1) or remove rows from (sign -1) the rollups
+
+        changes is an iterable of (estimate row, sign); see RollupDelta.add.
+        """
+        delta = RollupDelta()
+        for row, sign in changes:
+            delta.add(row, sign)
+        delta.write(tx)
+
+    def add_estimate(self, tx, estimate_id):
+        """Count a just-inserted estimate"""
+        row = tx.execute(
+            """SELECT created_at, material_quality, num_floors, cost_per_sqft
+            FROM estimates WHERE id = %s""",
+            (estimate_id,),
+            fetch_one=True
+        )
+        if row:
+            self.apply(tx, [(row, 1)])
+
+    def rebuild(self):
+        """Recompute all rollups from the estimates table; returns estimates counted
+
+        Runs in one transaction. Estimates saved while it runs may be
+        missed, so run it when the API is quiet (e.g. after a backfill).
+        """
+        delta = RollupDelta()
+        counted = 0
+        with self.db.transaction() as tx:
+            rows = tx.execute(
+                """SELECT created_at, material_quality, num_floors, cost_per_sqft FROM estimates
+                WHERE cost_per_sqft IS NOT NULL""",
+                fetch=True
+            )
+            for row in rows:
+                delta.add(row)
+                counted += 1
+
+            tx.execute("DELETE FROM estimate_rollup_buckets")
+            tx.execute("DELETE FROM estimate_rollups")
+            tx.execute_many(
+                """INSERT INTO estimate_rollups
+                (month, material_quality, num_floors, estimate_count, cost_per_sqft_sum, cost_per_sqft_sq_sum)
+                VALUES (%s, %s, %s, %s, %s, %s)""",
+                delta.group_rows()
+            )
+            tx.execute_many(
+                """INSERT INTO estimate_rollup_buckets
+                (month, material_quality, num_floors, bucket, estimate_count)
+                VALUES (%s, %s, %s, %s, %s)""",
+                delta.bucket_rows()
+            )
+        return counted
+
+    def summary(self, group_by=(), filters=None, percentiles=DEFAULT_PERCENTILES):
+        """Get cost_per_sqft statistics per group of the requested dimensions
+
+        filters may hold month_from / month_to ('YYYY-MM'), material_quality
+        and num_floors. Returns None if the rollups can't be read.
+        """
+        conditions = ['estimate_count > 0']
+        params = []
+        filters = filters or {}
+        if filters.get('month_from'):
+            conditions.append('month >= %s')
+            params.append(filters['month_from'])
+        if filters.get('month_to'):
+            conditions.append('month <= %s')
+            params.append(filters['month_to'])
+        for column in ('material_quality', 'num_floors'):
+            if filters.get(column) is not None:
+                conditions.append(f'{column} = %s')
+                params.append(filters[column])
+        where = ' AND '.join(conditions)
+
+        rollups = self.db.execute_query(
+            f"""SELECT month, material_quality, num_floors, estimate_count,
+            cost_per_sqft_sum, cost_per_sqft_sq_sum FROM estimate_rollups WHERE {where}""",
+            tuple(params),
+            fetch=True
+        )
+        histogram = self.db.execute_query(
+            f"""SELECT month, material_quality, num_floors, bucket, estimate_count
+            FROM estimate_rollup_buckets WHERE {where}""",
+            tuple(params),
+            fetch=True
+        )
+        if rollups is None or histogram is None:
+            return None
+
+        groups = {}
+        for row in rollups:
+            group = groups.setdefault(tuple(row[d] for d in group_by), [0, 0.0, 0.0, {}])
+            group[0] += row['estimate_count']
+            group[1] += float(row['cost_per_sqft_sum'])
+            group[2] += float(row['cost_per_sqft_sq_sum'])
+        for row in histogram:
+            group = groups.get(tuple(row[d] for d in group_by))
+            if group is not None:
+                group[3][row['bucket']] = group[3].get(row['bucket'], 0) + row['estimate_count']
+
+        results = []
+        for key in sorted(groups, key=lambda key: tuple(str(value) for value in key)):
+            count, total, squares, counts = groups[key]
+            average = total / count
+            variance = max(squares / count - average * average, 0.0)
+            result = dict(zip(group_by, key))
+            result.update({
+                'estimate_count': count,
+                'avg_cost_per_sqft': round(average, 2),
+                'stddev_cost_per_sqft': round(math.sqrt(variance), 2),
+                'percentiles': {str(p): _percentile(counts, p) for p in percentiles}
+            })
+            results.append(result)
+        return results
+
+
+def _percentile(counts, percentile):
+    """Estimate a percentile from histogram bucket counts
+
+    Values are assumed to be spread evenly (on the log scale) through
+    their bucket.
+    """
+    total = sum(count for count in counts.values() if count > 0)
+    if not total:
+        return None
+    rank = percentile / 100 * (total - 1)
+    seen = 0
+    for bucket in sorted(counts):
+        count = counts[bucket]
+        if count <= 0:
+            continue
+        if seen + count > rank:
+            return round(bucket_value(bucket, (rank - seen + 0.5) / count), 2)
+        seen += count
+    return round(bucket_value(max(counts), 1.0), 2)
+
+
+# Create a global cost rollups instance
+cost_rollups = CostRollups(db)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rebuild the cost analytics rollups from saved estimates')
+    parser.parse_args(argv)
+
+    counted = cost_rollups.rebuild()
+    print(f"Rebuilt cost rollups from {counted} estimates")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
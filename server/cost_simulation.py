@@ -0,0 +1,231 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Samples drawn per task. Fixed so that a given seed gives the same result
+# no matter how many worker processes run the chunks.
+CHUNK_SIZE = 100000
+
+# Worker processes for large simulations (0 runs everything in-process)
+SIMULATION_WORKERS = int(os.getenv('SIMULATION_WORKERS', os.cpu_count() or 1))
+
+DEFAULT_DISTRIBUTIONS = {
+    'price': {'type': 'triangular', 'low': -0.05, 'mode': 0.0, 'high': 0.15},
+    'ratio': {'type': 'normal', 'sd': 0.05},
+    'labor_days': {'type': 'uniform', 'low': -0.1, 'high': 0.2}
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def parse_distribution(spec, name):
+    """Validate a distribution spec, returned as a (type, params) tuple.
+
+    Distributions describe a relative deviation from the catalog value:
+    - normal: {sd}                      multiplier 1 + N(0, sd)
+    - uniform: {low, high}              multiplier 1 + U(low, high)
+    - triangular: {low, mode, high}     multiplier 1 + Tri(low, mode, high)
+    - lognormal: {sigma}                multiplier with mean 1
+    - fixed: {}                         multiplier 1
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f'{name} distribution must be an object')
+
+    kind = spec.get('type')
+    try:
+        if kind == 'normal':
+            params = (float(spec['sd']),)
+            valid = params[0] >= 0
+        elif kind == 'uniform':
+            params = (float(spec['low']), float(spec['high']))
+            valid = params[0] <= params[1]
+        elif kind == 'triangular':
+            params = (float(spec['low']), float(spec.get('mode', 0)), float(spec['high']))
+            valid = params[0] <= params[1] <= params[2] and params[0] < params[2]
+        elif kind == 'lognormal':
+            params = (float(spec['sigma']),)
+            valid = params[0] >= 0
+        elif kind == 'fixed':
+            params = ()
+            valid = True
+        else:
+            raise ValueError(f'{name} distribution type must be normal, uniform, triangular, lognormal or fixed')
+    except (KeyError, TypeError):
+        raise ValueError(f'{name} distribution is missing numeric parameters')
+
+    if not valid or not all(math.isfinite(param) for param in params):
+        raise ValueError(f'{name} distribution parameters are out of range')
+
+    return kind, params
+
+
+def _sample_multipliers(rng, distribution, size):
+    kind, params = distribution
+    if kind == 'normal':
+        values = 1 + rng.normal(0.0, params[0], size)
+    elif kind == 'uniform':
+        values = 1 + rng.uniform(params[0], params[1], size)
+    elif kind == 'triangular':
+        values = 1 + rng.triangular(params[0], params[1], params[2], size)
+    elif kind == 'lognormal':
+        values = rng.lognormal(-params[0] ** 2 / 2, params[0], size)
+    else:
+        values = np.ones(size)
+    return np.maximum(values, 0.0)
+
+
+def _simulate_chunk(task):
+    """Draw one chunk of samples and return its partial aggregates"""
+    (seed, size, total_area, base_days, ratios, rates, labor_rate_total,
+     price_distributions, ratio_distributions, days_distribution, baseline) = task
+    rng = np.random.default_rng(seed)
+
+    material_costs = np.empty((size, len(ratios)))
+    for i in range(len(ratios)):
+        ratio = ratios[i] * _sample_multipliers(rng, ratio_distributions[i], size)
+        rate = rates[i] * _sample_multipliers(rng, price_distributions[i], size)
+        material_costs[:, i] = total_area * ratio * rate
+
+    labor_cost = base_days * labor_rate_total * _sample_multipliers(rng, days_distribution, size)
+    components = np.column_stack([material_costs, labor_cost])
+    totals = components.sum(axis=1)
+
+    # Deviations from the deterministic estimate keep the covariance sums
+    # well conditioned when combined across chunks
+    component_deviation = components - baseline[:-1]
+    total_deviation = totals - baseline[-1]
+
+    return (
+        totals,
+        component_deviation.sum(axis=0),
+        total_deviation.sum(),
+        (component_deviation * total_deviation[:, None]).sum(axis=0)
+    )
+
+
+def _reset_executor_after_fork():
+    global _executor, _executor_lock
+    # The parent's pool processes belong to the parent
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawn rather than fork so workers do not inherit the server's
+            # threads, locks and open database connections
+            _executor = ProcessPoolExecutor(
+                max_workers=SIMULATION_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def simulate(plan, plot_area, num_floors, samples, seed=None, distributions=None):
+    """Run a Monte Carlo cost-risk simulation for one building.
+
+    Material prices, consumption ratios and labor days are sampled from the
+    given distributions (see parse_distribution). `distributions` may hold
+    'price', 'ratio' and 'labor_days' defaults plus per-material overrides
+    under 'materials': {name: {'price': ..., 'ratio': ...}}.
+    """
+    distributions = distributions or {}
+    if not isinstance(distributions, dict):
+        raise ValueError('distributions must be an object')
+    defaults = {
+        key: parse_distribution(distributions.get(key, DEFAULT_DISTRIBUTIONS[key]), key)
+        for key in DEFAULT_DISTRIBUTIONS
+    }
+
+    overrides = distributions.get('materials') or {}
+    if not isinstance(overrides, dict):
+        raise ValueError('materials must map material names to distributions')
+    unknown = [m for m in overrides if m not in plan.materials]
+    if unknown:
+        raise ValueError(f'Unknown materials in distributions: {", ".join(unknown)}')
+
+    price_distributions = []
+    ratio_distributions = []
+    for material in plan.materials:
+        override = overrides.get(material) or {}
+        if not isinstance(override, dict):
+            raise ValueError(f'{material} distributions must be an object')
+        price_distributions.append(
+            parse_distribution(override['price'], f'{material} price') if 'price' in override
+            else defaults['price']
+        )
+        ratio_distributions.append(
+            parse_distribution(override['ratio'], f'{material} ratio') if 'ratio' in override
+            else defaults['ratio']
+        )
+
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 63))
+
+    total_area = plot_area * num_floors
+    base_days = plan.labor_days(total_area)
+    ratios = np.asarray(plan.ratio_vector)
+    rates = np.asarray(plan.rates)
+    baseline = np.append(total_area * plan.cost_vector, base_days * plan.labor_rate_total)
+    baseline = np.append(baseline, baseline.sum())
+
+    chunk_sizes = [CHUNK_SIZE] * (samples // CHUNK_SIZE)
+    if samples % CHUNK_SIZE:
+        chunk_sizes.append(samples % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    tasks = [
+        (chunk_seed, size, total_area, base_days, ratios, rates, plan.labor_rate_total,
+         price_distributions, ratio_distributions, defaults['labor_days'], baseline)
+        for chunk_seed, size in zip(seeds, chunk_sizes)
+    ]
+
+    if len(tasks) > 1 and SIMULATION_WORKERS > 0:
+        results = list(_get_executor().map(_simulate_chunk, tasks))
+    else:
+        results = [_simulate_chunk(task) for task in tasks]
+
+    totals = np.concatenate([result[0] for result in results])
+    component_sum = sum(result[1] for result in results)
+    total_sum = sum(result[2] for result in results)
+    cross_sum = sum(result[3] for result in results)
+
+    # Share of total variance from each component: cov(component, total) / var(total)
+    variance = totals.var()
+    covariance = cross_sum / samples - (component_sum / samples) * (total_sum / samples)
+    shares = covariance / variance if variance > 0 else np.zeros_like(covariance)
+    contribution = dict(zip(list(plan.materials) + ['Labor'], np.round(shares, 4).tolist()))
+
+    p10, p50, p90 = np.percentile(totals, [10, 50, 90])
+
+    return {
+        'samples': samples,
+        'seed': seed,
+        'chunks': len(tasks),
+        'deterministic_total_cost': round(float(baseline[-1]), 2),
+        'total_cost': {
+            'mean': round(float(totals.mean()), 2),
+            'std': round(float(np.sqrt(variance)), 2),
+            'min': round(float(totals.min()), 2),
+            'p10': round(float(p10), 2),
+            'p50': round(float(p50), 2),
+            'p90': round(float(p90), 2),
+            'max': round(float(totals.max()), 2)
+        },
+        'cost_per_sqft': {
+            'p10': round(float(p10 / total_area), 2),
+            'p50': round(float(p50 / total_area), 2),
+            'p90': round(float(p90 / total_area), 2)
+        },
+        'variance_contribution': contribution
+    }
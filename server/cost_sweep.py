@@ -0,0 +1,145 @@
+import math
+import numpy as np
+from cost_plan import CostPlan
+
+
+def _axis_range(spec, name):
+    """Validate a {start, stop, step} axis; returns (start, step, count)"""
+    try:
+        start = float(spec['start'])
+        stop = float(spec['stop'])
+        step = float(spec.get('step', 1))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'{name} range needs numeric start, stop and step')
+    if not all(math.isfinite(value) for value in (start, stop, step)):
+        raise ValueError(f'{name} range must be finite')
+    if step <= 0 or stop < start:
+        raise ValueError(f'{name} range must have step > 0 and stop >= start')
+    # The tolerance keeps stop in ranges like 0..1 by 0.1
+    intervals = (stop - start) / step
+    if not math.isfinite(intervals):
+        raise ValueError(f'{name} range has too many values')
+    return start, step, math.floor(intervals + 1e-9) + 1
+
+
+def axis_size(spec, name):
+    """Count the values of a sweep axis without building it"""
+    if isinstance(spec, dict):
+        return _axis_range(spec, name)[2]
+    return len(spec) if isinstance(spec, list) else 1
+
+
+def parse_axis(spec, name, integer=False, max_points=None):
+    """Parse a sweep axis: a number, a list of numbers, or {start, stop, step}.
+
+    Ranges include the stop value. Axes longer than max_points are
+    rejected before any array is allocated. Raises ValueError with a
+    client-facing message on bad input.
+    """
+    size = axis_size(spec, name)
+    if max_points is not None and size > max_points:
+        raise ValueError(f'{name} has {size} values; at most {max_points} are allowed')
+
+    if isinstance(spec, dict):
+        start, step, count = _axis_range(spec, name)
+        values = start + step * np.arange(count, dtype=np.float64)
+    else:
+        if not isinstance(spec, list):
+            spec = [spec]
+        try:
+            values = np.asarray(spec, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} values must be numeric')
+
+    if values.ndim != 1 or values.size == 0:
+        raise ValueError(f'{name} needs at least one value')
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f'{name} values must be finite')
+    if integer:
+        if not np.all(values == np.trunc(values)):
+            raise ValueError(f'{name} values must be whole numbers')
+        values = values.astype(np.int64)
+    if not np.all(values > 0):
+        raise ValueError(f'{name} values must be positive')
+
+    return values
+
+
+def sweep(snapshot, lengths, breadths, floors, qualities, perturbations=None):
+    """Evaluate construction cost over a grid of plot sizes, floors and qualities.
+
+    All qualities are stacked into one coefficient matrix (zero where a
+    quality has no price for a material) and the whole grid is computed as
+    a single broadcast. `perturbations` maps material name to a fractional
+    price change (0.1 = +10%) applied on top of the baseline surface.
+    """
+    perturbations = perturbations or {}
+    plans = [snapshot.cost_plan(quality) for quality in qualities]
+
+    # Union of materials across the swept qualities, in catalog order
+    materials = []
+    for plan in plans:
+        for material in plan.materials:
+            if material not in materials:
+                materials.append(material)
+
+    unknown = [m for m in perturbations if m not in materials]
+    if unknown:
+        raise ValueError(f'Unknown materials in price perturbations: {", ".join(unknown)}')
+
+    column = {material: i for i, material in enumerate(materials)}
+    coefficients = np.zeros((len(plans), len(materials)))
+    labor_rate_totals = np.empty(len(plans))
+    for q, plan in enumerate(plans):
+        for material, coefficient in zip(plan.materials, plan.cost_vector):
+            coefficients[q, column[material]] = coefficient
+        labor_rate_totals[q] = plan.labor_rate_total
+
+    shift = np.array([perturbations.get(material, 0.0) for material in materials])
+
+    # Broadcast to (quality, length, breadth, floors[, material])
+    area = (lengths[:, None, None] * breadths[None, :, None] * floors[None, None, :])[None]
+    material_costs = area[..., None] * coefficients[:, None, None, None, :]
+    material_total = material_costs.sum(axis=-1)
+    labor_total = CostPlan.labor_days_vector(area) * labor_rate_totals[:, None, None, None]
+    total_cost = material_total + labor_total
+    cost_per_sqft = total_cost / area
+
+    # Elasticity of total cost to each material price is its cost share
+    elasticity = material_costs / total_cost[..., None]
+    deltas = material_costs * shift
+    perturbed_total_cost = total_cost + deltas.sum(axis=-1)
+
+    surfaces = {}
+    for q, quality in enumerate(qualities):
+        sensitivities = {}
+        for material in plans[q].materials:
+            m = column[material]
+            sensitivity = {
+                'elasticity': np.round(elasticity[q, ..., m], 6).tolist(),
+                'delta_per_percent': np.round(material_costs[q, ..., m] * 0.01, 2).tolist()
+            }
+            if material in perturbations:
+                sensitivity['perturbation'] = float(shift[m])
+                sensitivity['delta_total_cost'] = np.round(deltas[q, ..., m], 2).tolist()
+            sensitivities[material] = sensitivity
+
+        surface = {
+            'total_cost': np.round(total_cost[q], 2).tolist(),
+            'cost_per_sqft': np.round(cost_per_sqft[q], 2).tolist(),
+            'sensitivities': sensitivities
+        }
+        if perturbations:
+            surface['perturbed_total_cost'] = np.round(perturbed_total_cost[q], 2).tolist()
+        surfaces[quality] = surface
+
+    return {
+        'axes': {
+            'length': lengths.tolist(),
+            'breadth': breadths.tolist(),
+            'num_floors': floors.tolist(),
+            'quality': list(qualities)
+        },
+        'shape': [len(lengths), len(breadths), len(floors)],
+        'surfaces': surfaces
+    }
@@ -1,10 +1,246 @@
-import mysql.connector
-from mysql.connector import Error, pooling
+from mysql.connector import Error, InterfaceError, OperationalError
 import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g, has_request_context, request
+from itsdangerous import BadSignature, TimestampSigner
+from db_backends import create_backend
+from db_pool import ConnectionPool, PoolTimeout
+from query_stats import query_stats
+import migrations
 
 load_dotenv()
 
+# Every Database instance, so pools can be reset in forked children
+_instances = weakref.WeakSet()
+
+# Pools inherited from a parent process. Their sockets are shared with the
+# parent, so they are kept referenced (never closed or garbage collected)
+# rather than disconnected from the child.
+_inherited_pools = []
+
+# Rows per multi-row INSERT statement in execute_many
+BATCH_CHUNK_SIZE = int(os.getenv('DB_BATCH_CHUNK_SIZE', 500))
+
+# Rows fetched per round trip by stream_query
+STREAM_CHUNK_SIZE = int(os.getenv('DB_STREAM_CHUNK_SIZE', 500))
+
+# Seconds a client's reads stay on the primary after it writes
+REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+
+# Cookie and header carrying the signed time of a client's last write
+LAST_WRITE_COOKIE = 'db_last_write'
+LAST_WRITE_HEADER = 'X-DB-Last-Write'
+
+# Seconds an unreachable replica is skipped before it is tried again
+REPLICA_RETRY_SECONDS = float(os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+
+# Driver errors meaning the server is unreachable rather than the query invalid
+_CONNECTION_ERRORS = (InterfaceError, OperationalError)
+
+# Statements that are safe to run on a replica
+_READ_PATTERN = re.compile(
+    r'^\s*(SELECT|SHOW)\b(?!.*\b(FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b)',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Locking reads, which must run inside a write transaction
+_LOCKING_PATTERN = re.compile(r'\b(FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b', re.IGNORECASE)
+
+# INSERT ... VALUES followed by exactly one row tuple and nothing else (no
+# ON DUPLICATE KEY UPDATE etc.); the tuple may hold calls like NOW() but no
+# string literals
+_VALUES_PATTERN = re.compile(
+    r'^(\s*INSERT\b(?:(?!\bVALUES\b).)*\bVALUES\s*)(\((?:[^()\'"]|\([^()\'"]*\))*\))\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+def _run_statement(connection, cursor, query, params, fetch=False, fetch_one=False):
+    """Execute a statement and fetch its result, recording its latency"""
+    started = time.perf_counter()
+    try:
+        cursor.execute(query, params or ())
+        if fetch_one:
+            result = cursor.fetchone()
+        elif fetch:
+            result = cursor.fetchall()
+        else:
+            result = None
+    except Error:
+        query_stats.record(query, time.perf_counter() - started, error=True)
+        raise
+    
+    query_stats.record(
+        query,
+        time.perf_counter() - started,
+        explain=lambda: _explain(connection, query, params)
+    )
+    return result
+
+def _explain(connection, query, params):
+    """Get the EXPLAIN plan for a SELECT statement"""
+    if not query.lstrip().upper().startswith('SELECT'):
+        return None
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(getattr(connection, 'explain_prefix', 'EXPLAIN ') + query, params or ())
+        return [
+            {key: value if isinstance(value, (int, float)) or value is None else str(value)
+             for key, value in row.items()}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+class Transaction:
+    """Statements run on one connection inside Database.transaction()
+
+    Unlike Database.execute_query, errors are raised so the whole
+    transaction is rolled back.
+    """
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor(dictionary=True)
+    
+    def execute(self, query, params=None, fetch=False, fetch_one=False):
+        """Execute a query; returns rows, one row, or the last inserted id"""
+        if _LOCKING_PATTERN.search(query):
+            # Backends without row locks (SQLite) lock the database instead
+            lock_for_update = getattr(self.connection, 'lock_for_update', None)
+            if lock_for_update is not None:
+                lock_for_update()
+        result = _run_statement(self.connection, self.cursor, query, params, fetch, fetch_one)
+        if fetch or fetch_one:
+            return result
+        return self.cursor.lastrowid
+    
+    @property
+    def rowcount(self):
+        """Rows affected by the last statement"""
+        return self.cursor.rowcount
+    
+    def execute_many(self, query, rows, chunk_size=None):
+        """Execute a statement for many parameter rows; returns rows affected
+
+        INSERT ... VALUES (...) statements are rewritten into multi-row
+        VALUES lists of up to chunk_size rows each. Other statements,
+        including INSERTs with anything after the row tuple, fall back to
+        the driver's executemany.
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+        
+        match = _VALUES_PATTERN.match(query)
+        if not match:
+            started = time.perf_counter()
+            try:
+                self.cursor.executemany(query, rows)
+            finally:
+                query_stats.record(query, time.perf_counter() - started)
+            return self.cursor.rowcount
+        
+        prefix, row_template = match.group(1), match.group(2)
+        chunk_size = chunk_size or BATCH_CHUNK_SIZE
+        affected = 0
+        
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            statement = prefix + ', '.join([row_template] * len(chunk))
+            _run_statement(self.connection, self.cursor, statement,
+                           [value for row in chunk for value in row])
+            affected += self.cursor.rowcount
+        
+        return affected
+    
+    def update_many(self, table, key, columns, rows, chunk_size=None):
+        """Update many rows by key with one UPDATE per chunk; returns rows affected
+
+        Each row is (key_value, column_value, ...) in the order of columns.
+        The values are applied with CASE expressions, so a chunk of
+        chunk_size rows costs one round trip.
+        """
+        rows = [tuple(row) for row in rows]
+        chunk_size = chunk_size or BATCH_CHUNK_SIZE
+        affected = 0
+        
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            assignments = []
+            params = []
+            for i, column in enumerate(columns, start=1):
+                whens = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+                assignments.append(f"{column} = CASE {key} {whens} END")
+                for row in chunk:
+                    params.extend((row[0], row[i]))
+            params.extend(row[0] for row in chunk)
+            
+            statement = (f"UPDATE {table} SET {', '.join(assignments)} "
+                         f"WHERE {key} IN ({', '.join(['%s'] * len(chunk))})")
+            _run_statement(self.connection, self.cursor, statement, params)
+            affected += self.cursor.rowcount
+        
+        return affected
+    
+    def close(self):
+        self.cursor.close()
+
+class RowStream:
+    """Iterator over the rows of a query run by Database.stream_query
+
+    The connection is returned to the pool when the rows run out or
+    close() is called, whether or not iteration ever started.
+    """
+    
+    def __init__(self, connection, cursor, chunk_size):
+        self.connection = connection
+        self.cursor = cursor
+        self.chunk_size = chunk_size
+        self._rows = iter(())
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self.connection is None:
+            raise StopIteration
+        for row in self._rows:
+            return row
+        try:
+            rows = self.cursor.fetchmany(self.chunk_size)
+        except Error as e:
+            print(f"Error streaming query results: {e}")
+            self.close()
+            raise StopIteration
+        if not rows:
+            self._release(finished=True)
+            raise StopIteration
+        self._rows = iter(rows)
+        return next(self._rows)
+    
+    def _release(self, finished):
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        if finished:
+            self.cursor.close()
+        else:
+            # Unread results are still on the wire; don't reuse the connection
+            connection.invalidate()
+        connection.close()
+    
+    def close(self):
+        """Stop reading and release the connection"""
+        self._release(finished=False)
+    
+    def __del__(self):
+        self.close()
+
 class Database:
     def __init__(self):
         self.config = {
@@ -15,140 +251,369 @@ class Database:
             'port': int(os.getenv('DB_PORT', 3306))
         }
         
-        # Create connection pool
-        try:
-            self.pool = pooling.MySQLConnectionPool(
-                pool_name="construction_pool",
-                pool_size=5,
-                **self.config
-            )
-        except Error as e:
-            print(f"Error creating connection pool: {e}")
-            self.pool = None
+        self.pool_options = {
+            'size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 5)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            'recycle': float(os.getenv('DB_POOL_RECYCLE', 3600)),
+            'pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+        }
+        
+        # MySQL server, or embedded SQLite (DB_BACKEND=sqlite)
+        self.backend = create_backend(self.config)
+        if getattr(self.backend, 'memory', False):
+            # Connections to an in-memory database share table locks; use one at a time
+            self.pool_options.update(size=1, max_overflow=0, recycle=0)
+        
+        # Read replicas (DB_REPLICA_HOSTS=host[:port],...) share the primary's credentials
+        self.replica_configs = []
+        for entry in os.getenv('DB_REPLICA_HOSTS', '').split(','):
+            host, _, port = entry.strip().partition(':')
+            if host and self.backend.supports_replicas:
+                self.replica_configs.append(
+                    dict(self.config, host=host, port=int(port or self.config['port']))
+                )
+        
+        # Signs the last-write marker handed to clients (see init_app)
+        self._write_signer = None
+        
+        # The pools are created lazily, once per process
+        self._pool = None
+        self._replica_pools = []
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        
+        self._routing_lock = threading.Lock()
+        self._replica_down_until = {}
+        self._replica_next = 0
+        self.routing = {'replica_reads': 0, 'sticky_reads': 0, 'fallbacks': 0, 'replica_failures': 0}
+        _instances.add(self)
+    
+    @property
+    def pool(self):
+        """Connection pool owned by the current process, created on first use"""
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._pool_lock:
+                if self._pool is not None and self._pool_pid != pid:
+                    # Forked without the at-fork hook running
+                    self._abandon_pool()
+                if self._pool is None:
+                    self._pool = ConnectionPool(self.backend.connect, **self.pool_options)
+                    self._replica_pools = [
+                        ConnectionPool(
+                            lambda config=config: self.backend.connect(config),
+                            **self.pool_options
+                        )
+                        for config in self.replica_configs
+                    ]
+                    self._pool_pid = pid
+        return self._pool
+    
+    @property
+    def replica_pools(self):
+        """Replica connection pools owned by the current process"""
+        self.pool
+        return self._replica_pools
+    
+    def _abandon_pool(self):
+        if self._pool is not None:
+            _inherited_pools.append(self._pool)
+        _inherited_pools.extend(self._replica_pools)
+        self._pool = None
+        self._replica_pools = []
+        self._pool_pid = None
+        self._replica_down_until = {}
+    
+    def reset_after_fork(self):
+        """Drop the pools inherited from the parent process without closing them"""
+        self._pool_lock = threading.Lock()
+        self._routing_lock = threading.Lock()
+        self._abandon_pool()
+    
+    def dispose(self):
+        """Close this process's idle connections (e.g. before forking workers)"""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.dispose()
+                for pool in self._replica_pools:
+                    pool.dispose()
     
     def get_connection(self):
-        """Get a connection from the pool"""
+        """Get a connection from the pool, waiting briefly if it is exhausted"""
         try:
-            return self.pool.get_connection()
-        except Error as e:
+            return self.pool.acquire()
+        except (Error, PoolTimeout) as e:
             print(f"Error getting connection from pool: {e}")
             return None
     
-    def execute_query(self, query, params=None, fetch=False, fetch_one=False):
-        """Execute a query and optionally fetch results"""
+    def pool_stats(self):
+        """Get connection pool statistics"""
+        stats = self.pool.stats()
+        if self.replica_configs:
+            now = time.monotonic()
+            with self._routing_lock:
+                down = dict(self._replica_down_until)
+                stats['routing'] = dict(self.routing)
+            stats['replicas'] = [
+                dict(pool.stats(), host=config['host'], port=config['port'],
+                     available=down.get(index, 0) <= now)
+                for index, (config, pool) in enumerate(zip(self.replica_configs, self.replica_pools))
+            ]
+        return stats
+    
+    def init_app(self, app):
+        """Keep each client's reads on the primary right after its writes
+
+        A request that writes gets a signed timestamp back, as a cookie and
+        an X-DB-Last-Write header. Requests presenting it (either way)
+        within DB_REPLICA_STICKY_SECONDS read from the primary, whichever
+        worker process serves them.
+        """
+        self._write_signer = TimestampSigner(app.config['SECRET_KEY'], salt='db-last-write')
+        
+        @app.after_request
+        def add_last_write(response):
+            if g.get('db_wrote'):
+                token = self._write_signer.sign(b'w').decode()
+                response.headers[LAST_WRITE_HEADER] = token
+                response.set_cookie(LAST_WRITE_COOKIE, token, max_age=max(int(REPLICA_STICKY_SECONDS), 1),
+                                    httponly=True, samesite='Lax')
+            return response
+    
+    def _mark_write(self):
+        """Keep the current request's client on the primary for a short window
+
+        Writes made outside a request (background jobs, CLI tools) don't
+        affect any client's reads.
+        """
+        if self.replica_configs and REPLICA_STICKY_SECONDS > 0 and has_request_context():
+            g.db_wrote = True
+    
+    def _is_sticky(self):
+        if not has_request_context():
+            return False
+        if g.get('db_wrote'):
+            return True
+        if 'db_recent_write' not in g:
+            g.db_recent_write = self._recent_write(
+                request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+            )
+        return g.db_recent_write
+    
+    def _recent_write(self, token):
+        if not token or self._write_signer is None:
+            return False
+        try:
+            self._write_signer.unsign(token, max_age=REPLICA_STICKY_SECONDS)
+        except BadSignature:
+            # Tampered with or older than the window
+            return False
+        return True
+    
+    def _mark_replica_down(self, index, error):
+        print(f"Replica {self.replica_configs[index]['host']} unavailable, reading from primary: {error}")
+        with self._routing_lock:
+            self._replica_down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+            self.routing['replica_failures'] += 1
+    
+    def _replica_for(self, query):
+        """Pick a replica connection for a read; returns (index, connection) or None
+
+        None means the read should go to the primary: no replicas are
+        configured, the statement is not a plain read, the client wrote
+        recently, or no replica is reachable or free. Busy replicas are
+        skipped without waiting, so saturated replicas cost nothing
+        before the primary fallback.
+        """
+        if not self.replica_configs or not _READ_PATTERN.match(query):
+            return None
+        
+        if self._is_sticky():
+            with self._routing_lock:
+                self.routing['sticky_reads'] += 1
+            return None
+        
+        pools = self.replica_pools
+        now = time.monotonic()
+        with self._routing_lock:
+            start = self._replica_next
+            self._replica_next = (start + 1) % len(pools)
+            down = dict(self._replica_down_until)
+        
+        for offset in range(len(pools)):
+            index = (start + offset) % len(pools)
+            if down.get(index, 0) > now:
+                continue
+            try:
+                connection = pools[index].acquire(timeout=0)
+            except PoolTimeout:
+                # Busy rather than down; try the next one
+                continue
+            except Error as e:
+                self._mark_replica_down(index, e)
+                continue
+            with self._routing_lock:
+                self.routing['replica_reads'] += 1
+            return index, connection
+        
+        with self._routing_lock:
+            self.routing['fallbacks'] += 1
+        return None
+    
+    def execute_query(self, query, params=None, fetch=False, fetch_one=False, primary=False):
+        """Execute a query and optionally fetch results
+
+        Reads (fetch / fetch_one SELECTs) go to a replica when replicas are
+        configured, unless primary=True or the client wrote recently. If
+        the replica is unreachable the read is retried on the primary.
+        """
+        replica = None
+        if (fetch or fetch_one) and not primary:
+            replica = self._replica_for(query)
+        
+        if replica is not None:
+            index, connection = replica
+            try:
+                cursor = connection.cursor(dictionary=True)
+                result = _run_statement(connection, cursor, query, params, fetch, fetch_one)
+                cursor.close()
+                return result
+            except _CONNECTION_ERRORS as e:
+                connection.invalidate()
+                self._mark_replica_down(index, e)
+            except Error as e:
+                print(f"Error executing query: {e}")
+                return None
+            finally:
+                connection.close()
+        
         connection = self.get_connection()
         if not connection:
             return None
         
         try:
             cursor = connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
+            result = _run_statement(connection, cursor, query, params, fetch, fetch_one)
             
-            if fetch_one:
-                result = cursor.fetchone()
-            elif fetch:
-                result = cursor.fetchall()
-            else:
+            if not fetch and not fetch_one:
                 connection.commit()
                 result = cursor.lastrowid
             
             cursor.close()
+            if not _READ_PATTERN.match(query):
+                self._mark_write()
             return result
         except Error as e:
             print(f"Error executing query: {e}")
-            connection.rollback()
+            try:
+                connection.rollback()
+            except Error:
+                # Broken connection: don't hand it back out
+                connection.invalidate()
+            return None
+        finally:
+            connection.close()
+    
+    def stream_query(self, query, params=None, chunk_size=None, primary=False):
+        """Execute a query and return an iterator over its rows
+
+        Rows are read from an unbuffered cursor chunk_size rows at a time,
+        so memory stays constant however large the result is. The
+        connection is held until the iterator is exhausted or closed, so
+        callers that may not read it to the end must call close().
+        Returns None if the query fails to start, like execute_query.
+        Reads are routed to replicas like execute_query.
+        """
+        replica = None if primary else self._replica_for(query)
+        if replica is not None:
+            index, connection = replica
+            try:
+                cursor = connection.cursor(dictionary=True, buffered=False)
+                started = time.perf_counter()
+                cursor.execute(query, params or ())
+                query_stats.record(query, time.perf_counter() - started)
+                return RowStream(connection, cursor, chunk_size or STREAM_CHUNK_SIZE)
+            except _CONNECTION_ERRORS as e:
+                connection.invalidate()
+                connection.close()
+                self._mark_replica_down(index, e)
+            except Error as e:
+                print(f"Error executing query: {e}")
+                connection.invalidate()
+                connection.close()
+                return None
+        
+        connection = self.get_connection()
+        if not connection:
+            return None
+        
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            started = time.perf_counter()
+            cursor.execute(query, params or ())
+            # Only the execute phase is timed; reading rows is paced by the client
+            query_stats.record(query, time.perf_counter() - started)
+        except Error as e:
+            print(f"Error executing query: {e}")
+            connection.invalidate()
+            connection.close()
             return None
+        
+        return RowStream(connection, cursor, chunk_size or STREAM_CHUNK_SIZE)
+    
+    @contextmanager
+    def transaction(self):
+        """Hold one connection for several statements, committing them together
+
+        Usage:
+            with db.transaction() as tx:
+                tx.execute(...)
+                tx.execute_many(...)
+
+        Any exception rolls the transaction back and is re-raised.
+        """
+        connection = self.get_connection()
+        if not connection:
+            raise Error("No database connection available")
+        
+        tx = Transaction(connection)
+        try:
+            yield tx
+            connection.commit()
+            self._mark_write()
+        except Exception:
+            try:
+                connection.rollback()
+            except Error:
+                connection.invalidate()
+            raise
         finally:
+            tx.close()
             connection.close()
     
+    def execute_many(self, query, rows, chunk_size=None):
+        """Execute a statement for many rows in one transaction"""
+        try:
+            with self.transaction() as tx:
+                return tx.execute_many(query, rows, chunk_size)
+        except Error as e:
+            print(f"Error executing batch: {e}")
+            return None
+    
     def init_db(self):
-        """Initialize database tables"""
+        """Create the database, apply schema migrations and seed default data"""
         # Create database if not exists
         try:
-            temp_config = self.config.copy()
-            temp_config.pop('database')
-            connection = mysql.connector.connect(**temp_config)
-            cursor = connection.cursor()
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.config['database']}")
-            cursor.close()
-            connection.close()
+            self.backend.create_database()
         except Error as e:
             print(f"Error creating database: {e}")
         
-        # Create tables
-        tables = [
-            # Users table
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            
-            # Material prices table
-            """
-            CREATE TABLE IF NOT EXISTS material_prices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                material_name VARCHAR(100) NOT NULL,
-                unit VARCHAR(20) NOT NULL,
-                price DECIMAL(10, 2) NOT NULL,
-                quality VARCHAR(50) DEFAULT 'standard',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            
-            # Labor rates table
-            """
-            CREATE TABLE IF NOT EXISTS labor_rates (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                labor_type VARCHAR(100) NOT NULL,
-                rate DECIMAL(10, 2) NOT NULL,
-                unit VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            
-            # Estimates table
-            """
-            CREATE TABLE IF NOT EXISTS estimates (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id INT,
-                project_name VARCHAR(200),
-                plot_length DECIMAL(10, 2),
-                plot_breadth DECIMAL(10, 2),
-                total_area DECIMAL(10, 2),
-                num_floors INT,
-                material_quality VARCHAR(50),
-                total_cost DECIMAL(15, 2),
-                cost_per_sqft DECIMAL(10, 2),
-                estimate_data JSON,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-            """,
-            
-            # Consumption ratios table
-            """
-            CREATE TABLE IF NOT EXISTS consumption_ratios (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                material_name VARCHAR(100) NOT NULL,
-                ratio_per_sqft DECIMAL(10, 4) NOT NULL,
-                unit VARCHAR(20) NOT NULL,
-                category VARCHAR(50),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """
-        ]
-        
-        for table_query in tables:
-            self.execute_query(table_query)
+        # Create or upgrade tables
+        try:
+            migrations.migrate(self)
+        except Error as e:
+            print(f"Error migrating database: {e}")
         
         # Insert default data
         self.insert_default_data()
@@ -157,15 +622,6 @@ class Database:
     
     def insert_default_data(self):
         """Insert default pricing and consumption data"""
-        # Check if data already exists
-        existing_materials = self.execute_query(
-            "SELECT COUNT(*) as count FROM material_prices",
-            fetch_one=True
-        )
-        
-        if existing_materials and existing_materials['count'] > 0:
-            return
-        
         # Default material prices
         materials = [
             ('Cement', 'bag', 350.00, 'standard'),
@@ -182,12 +638,6 @@ class Database:
             ('Tiles (Floor)', 'sqft', 85.00, 'premium'),
         ]
         
-        for material in materials:
-            self.execute_query(
-                "INSERT INTO material_prices (material_name, unit, price, quality) VALUES (%s, %s, %s, %s)",
-                material
-            )
-        
         # Default labor rates
         labor = [
             ('Mason', 800.00, 'day'),
@@ -198,12 +648,6 @@ class Database:
             ('Painter', 700.00, 'day'),
         ]
         
-        for labor_item in labor:
-            self.execute_query(
-                "INSERT INTO labor_rates (labor_type, rate, unit) VALUES (%s, %s, %s)",
-                labor_item
-            )
-        
         # Default consumption ratios
         ratios = [
             ('Cement', 0.4, 'bag', 'construction'),
@@ -215,13 +659,42 @@ class Database:
             ('Tiles (Floor)', 1.1, 'sqft', 'finishing'),
         ]
         
-        for ratio in ratios:
-            self.execute_query(
-                "INSERT INTO consumption_ratios (material_name, ratio_per_sqft, unit, category) VALUES (%s, %s, %s, %s)",
-                ratio
-            )
+        # Seed everything on one connection in a single transaction
+        try:
+            with self.transaction() as tx:
+                # Check if data already exists
+                existing_materials = tx.execute(
+                    "SELECT COUNT(*) as count FROM material_prices",
+                    fetch_one=True
+                )
+                
+                if existing_materials and existing_materials['count'] > 0:
+                    return
+                
+                tx.execute_many(
+                    "INSERT INTO material_prices (material_name, unit, price, quality) VALUES (%s, %s, %s, %s)",
+                    materials
+                )
+                tx.execute_many(
+                    "INSERT INTO labor_rates (labor_type, rate, unit) VALUES (%s, %s, %s)",
+                    labor
+                )
+                tx.execute_many(
+                    "INSERT INTO consumption_ratios (material_name, ratio_per_sqft, unit, category) VALUES (%s, %s, %s, %s)",
+                    ratios
+                )
+        except Error as e:
+            print(f"Error inserting default data: {e}")
+            return
         
         print("Default data inserted successfully!")
 
+def _reset_pools_after_fork():
+    for database in list(_instances):
+        database.reset_after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
 # Create a global database instance
 db = Database()
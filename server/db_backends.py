@@ -0,0 +1,235 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+import mysql.connector
+from mysql.connector import Error
+
+
+class MySQLBackend:
+    """MySQL server accessed through mysql.connector"""
+
+    name = 'mysql'
+    supports_replicas = True
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self, config=None):
+        return mysql.connector.connect(**(config or self.config))
+
+    def create_database(self):
+        """Create the configured database if it does not exist"""
+        temp_config = self.config.copy()
+        temp_config.pop('database')
+        connection = mysql.connector.connect(**temp_config)
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.config['database']}")
+        cursor.close()
+        connection.close()
+
+
+# MySQL syntax used by the schema and route queries, rewritten for SQLite
+_SQLITE_REWRITES = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.IGNORECASE),
+     'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b', re.IGNORECASE), ''),
+    (re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE), 'ON CONFLICT DO UPDATE SET'),
+    # SQLite has no row locks; Transaction takes the database write lock
+    # first (see _SQLiteConnection.lock_for_update)
+    (re.compile(r'\s+FOR\s+UPDATE\b', re.IGNORECASE), ''),
+]
+_UPSERT_VALUES = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+
+# Return DECIMAL and TIMESTAMP columns as the same types mysql.connector does
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def translate_sql(query):
+    """Rewrite a MySQL statement for SQLite"""
+    for pattern, replacement in _SQLITE_REWRITES:
+        query = pattern.sub(replacement, query)
+    head, upsert, update = query.partition('ON CONFLICT DO UPDATE SET')
+    if upsert:
+        query = head + upsert + _UPSERT_VALUES.sub(r'excluded.\1', update)
+    return query
+
+
+def _raise_as_mysql_error(e):
+    # Same DB-API class names (IntegrityError, OperationalError, ...) as the
+    # MySQL driver, so Database's error handling applies unchanged
+    error_class = getattr(mysql.connector, type(e).__name__, Error)
+    raise error_class(str(e)) from e
+
+
+class _SQLiteCursor:
+    """mysql.connector-style cursor over a sqlite3 cursor"""
+
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def execute(self, query, params=()):
+        try:
+            self._cursor.execute(translate_sql(query), tuple(params or ()))
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def executemany(self, query, rows):
+        try:
+            self._cursor.executemany(translate_sql(query), [tuple(row) for row in rows])
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def fetchone(self):
+        try:
+            return self._row(self._cursor.fetchone())
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def fetchall(self):
+        try:
+            return [self._row(row) for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def fetchmany(self, size=1):
+        try:
+            return [self._row(row) for row in self._cursor.fetchmany(size)]
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """mysql.connector-style connection over a sqlite3 connection"""
+
+    explain_prefix = 'EXPLAIN QUERY PLAN '
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._open = True
+
+    def cursor(self, dictionary=False, buffered=None):
+        # SQLite cursors step through results lazily, so every cursor is unbuffered
+        return _SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def commit(self):
+        try:
+            self._connection.commit()
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def rollback(self):
+        try:
+            self._connection.rollback()
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    @property
+    def in_transaction(self):
+        return self._connection.in_transaction
+
+    def lock_for_update(self):
+        """Take the database write lock before a locking read
+
+        sqlite3 only begins a transaction before the first write, so a
+        SELECT ... FOR UPDATE would otherwise read without any lock and
+        concurrent read-modify-writes could interleave.
+        """
+        if self._connection.in_transaction:
+            return
+        try:
+            self._connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+        self._connection.close()
+
+
+class SQLiteBackend:
+    """Embedded SQLite database for single-node installs and benchmarks
+
+    A file path is opened in WAL mode, so readers don't block the writer
+    and several worker processes can share the file. ':memory:' keeps the
+    database in this process only, shared by its connections for as long
+    as the backend exists; use it for tests and benchmarks.
+    """
+
+    name = 'sqlite'
+    supports_replicas = False
+
+    _memory_databases = 0
+    _memory_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.memory = path == ':memory:'
+        self._keeper = None
+        if self.memory:
+            with SQLiteBackend._memory_lock:
+                SQLiteBackend._memory_databases += 1
+                number = SQLiteBackend._memory_databases
+            self.path = f'file:construction_estimation_{os.getpid()}_{number}?mode=memory&cache=shared'
+            # The database is dropped when its last connection closes
+            self._keeper = self._open()
+        else:
+            self.path = path
+
+    def _open(self):
+        try:
+            connection = sqlite3.connect(
+                self.path,
+                uri=self.memory,
+                timeout=30,
+                check_same_thread=False,
+                detect_types=sqlite3.PARSE_DECLTYPES
+            )
+            connection.execute("PRAGMA foreign_keys = ON")
+            if not self.memory:
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.Error as e:
+            _raise_as_mysql_error(e)
+        return connection
+
+    def connect(self, config=None):
+        return _SQLiteConnection(self._open())
+
+    def create_database(self):
+        """SQLite creates the database file on first connect"""
+
+
+def create_backend(config):
+    """Create the backend selected by DB_BACKEND (mysql or sqlite)"""
+    name = os.getenv('DB_BACKEND', 'mysql').lower()
+    if name == 'sqlite':
+        return SQLiteBackend(os.getenv('DB_SQLITE_PATH', 'construction_estimation.db'))
+    if name != 'mysql':
+        raise ValueError(f"Unknown DB_BACKEND '{name}'; expected 'mysql' or 'sqlite'")
+    return MySQLBackend(config)
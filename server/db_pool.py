@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import deque
+
+# Upper bounds (ms) of the acquire-latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class PooledConnection:
+    """A checked-out connection; close() returns it to the pool"""
+
+    def __init__(self, pool, connection, created_at):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+        self._discard = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def invalidate(self):
+        """Close the underlying connection instead of reusing it"""
+        self._discard = True
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        self._pool._release(connection, self._created_at, self._discard)
+
+
+class ConnectionPool:
+    """Thread-safe connection pool with overflow and bounded waits.
+
+    Up to `size` connections are kept open between requests. Under load up
+    to `max_overflow` extra connections are opened and closed again on
+    release. When both are used up, callers wait up to `timeout` seconds
+    for a connection before PoolTimeout is raised. Idle connections older
+    than `recycle` seconds are replaced, and with `pre_ping` each checkout
+    verifies the connection is still alive.
+    """
+
+    def __init__(self, connect, size=5, max_overflow=5, timeout=5.0,
+                 recycle=3600, pre_ping=True):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._total = 0
+        self._in_use = 0
+        self._waiters = 0
+
+        self.acquired = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.recycled = 0
+        self.ping_failures = 0
+        self._latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def acquire(self, timeout=None):
+        """Check out a connection, waiting up to timeout (default: the pool timeout)"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, created_at = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    connection, created_at = None, None
+                    self._total += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No database connection available after {timeout}s '
+                        f'({self._in_use} in use, {self._waiters} waiting)'
+                    )
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._in_use += 1
+
+        try:
+            connection, created_at = self._checkout(connection, created_at)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        self._record_latency(time.monotonic() - started)
+        return PooledConnection(self, connection, created_at)
+
+    def _checkout(self, connection, created_at):
+        # Pings and connects run unlocked; only the counters take the lock
+        if connection is not None:
+            if self.recycle and time.monotonic() - created_at > self.recycle:
+                with self._cond:
+                    self.recycled += 1
+                _close_quietly(connection)
+                connection = None
+            elif self.pre_ping and not _is_alive(connection):
+                with self._cond:
+                    self.ping_failures += 1
+                _close_quietly(connection)
+                connection = None
+
+        if connection is None:
+            connection = self._connect()
+            created_at = time.monotonic()
+            with self._cond:
+                self.connects += 1
+
+        return connection, created_at
+
+    def _release(self, connection, created_at, discard=False):
+        if not discard:
+            try:
+                if getattr(connection, 'in_transaction', False):
+                    connection.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.size:
+                self._total -= 1
+                close = True
+            else:
+                self._idle.append((connection, created_at))
+                close = False
+            self._cond.notify()
+
+        if close:
+            _close_quietly(connection)
+
+    def _record_latency(self, seconds):
+        ms = seconds * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS_MS)
+        with self._cond:
+            self.acquired += 1
+            self._latency_counts[i] += 1
+            self._latency_total += ms
+            self._latency_max = max(self._latency_max, ms)
+
+    def dispose(self):
+        """Close all idle connections"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+    def stats(self):
+        """Get live pool counters for monitoring"""
+        with self._cond:
+            histogram = {
+                f'le_{bound}ms': count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self._latency_counts)
+            }
+            histogram['gt_{}ms'.format(LATENCY_BUCKETS_MS[-1])] = self._latency_counts[-1]
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'open': self._total,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiters': self._waiters,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'recycled': self.recycled,
+                'ping_failures': self.ping_failures,
+                'acquire_latency_ms': {
+                    'avg': round(self._latency_total / self.acquired, 3) if self.acquired else 0.0,
+                    'max': round(self._latency_max, 3),
+                    'histogram': histogram
+                }
+            }
+
+
+def _is_alive(connection):
+    try:
+        return connection.is_connected()
+    except Exception:
+        return False
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+# One-byte format marker at the start of every stored estimate_data blob
+FORMAT_JSON = b'\x00'
+FORMAT_ZLIB = b'\x01'
+
+# Payloads smaller than this are stored as plain JSON; zlib doesn't pay off
+COMPRESS_MIN_BYTES = int(os.getenv('ESTIMATE_COMPRESS_MIN_BYTES', 256))
+COMPRESSION_LEVEL = int(os.getenv('ESTIMATE_COMPRESSION_LEVEL', 6))
+
+
+class EstimateCodec:
+    """Encode estimate_data for the estimates.estimate_blob column.
+
+    Blobs are compact JSON, zlib-compressed above COMPRESS_MIN_BYTES, and
+    prefixed with a format byte so other codecs can be added later. Rows
+    written before compression keep their JSON in estimate_data and are
+    still decoded. Tracks stored sizes and decode time for monitoring.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.decoded = 0
+        self.legacy_decoded = 0
+        self.decode_seconds = 0.0
+
+    def encode(self, data):
+        """Serialize estimate_data to a blob"""
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(raw) >= COMPRESS_MIN_BYTES:
+            blob = FORMAT_ZLIB + zlib.compress(raw, COMPRESSION_LEVEL)
+            compressed = True
+        else:
+            blob = FORMAT_JSON + raw
+            compressed = False
+
+        with self._lock:
+            self.encoded += 1
+            self.compressed += compressed
+            self.raw_bytes += len(raw)
+            self.stored_bytes += len(blob)
+        return blob
+
+    def decode(self, blob, legacy=None):
+        """Deserialize a blob, falling back to a legacy JSON estimate_data value"""
+        started = time.perf_counter()
+        if blob:
+            blob = bytes(blob)
+            marker, payload = blob[:1], blob[1:]
+            if marker == FORMAT_ZLIB:
+                payload = zlib.decompress(payload)
+            elif marker != FORMAT_JSON:
+                raise ValueError(f'Unknown estimate_data format {marker!r}')
+            data = json.loads(payload)
+            is_legacy = False
+        elif legacy:
+            data = json.loads(legacy)
+            is_legacy = True
+        else:
+            return None
+
+        with self._lock:
+            self.decoded += 1
+            self.legacy_decoded += is_legacy
+            self.decode_seconds += time.perf_counter() - started
+        return data
+
+    def decode_row(self, row):
+        """Replace a row's storage columns with its decoded estimate_data"""
+        row['estimate_data'] = self.decode(row.pop('estimate_blob', None), row.get('estimate_data'))
+        return row
+
+    def stats(self):
+        """Get size and decode counters for monitoring"""
+        with self._lock:
+            return {
+                'encoded': self.encoded,
+                'compressed': self.compressed,
+                'raw_bytes': self.raw_bytes,
+                'stored_bytes': self.stored_bytes,
+                'compression_ratio': round(self.raw_bytes / self.stored_bytes, 3) if self.stored_bytes else 0.0,
+                'decoded': self.decoded,
+                'legacy_decoded': self.legacy_decoded,
+                'decode_ms_total': round(self.decode_seconds * 1000, 3),
+                'decode_ms_avg': round(self.decode_seconds * 1000 / self.decoded, 3) if self.decoded else 0.0
+            }
+
+
+# Create a global estimate codec instance
+estimate_codec = EstimateCodec()
+
+
+def compress_legacy_rows(db, batch_size=500):
+    """Move JSON estimate_data values written before compression into blobs"""
+    converted = 0
+    while True:
+        rows = db.execute_query(
+            """SELECT id, estimate_data FROM estimates
+            WHERE estimate_blob IS NULL AND estimate_data IS NOT NULL LIMIT %s""",
+            (batch_size,),
+            fetch=True,
+            primary=True
+        )
+        if rows is None:
+            raise RuntimeError('Failed to read estimates')
+        if not rows:
+            return converted
+
+        with db.transaction() as tx:
+            tx.execute_many(
+                "UPDATE estimates SET estimate_blob = %s, estimate_data = NULL WHERE id = %s",
+                [(estimate_codec.encode(json.loads(row['estimate_data'])), row['id']) for row in rows]
+            )
+        converted += len(rows)
+
+
+def main(argv=None):
+    import argparse
+    from database import db
+
+    parser = argparse.ArgumentParser(description='Compress estimate_data stored before compression')
+    parser.add_argument('--batch-size', type=int, default=500, help='rows converted per transaction')
+    args = parser.parse_args(argv)
+
+    converted = compress_legacy_rows(db, args.batch_size)
+    stats = estimate_codec.stats()
+    print(f"Compressed {converted} estimates ({stats['raw_bytes']} -> {stats['stored_bytes']} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,262 @@
+import csv
+import json
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from email.utils import parsedate_to_datetime
+from cost_rollups import RollupDelta
+from database import db
+from estimate_store import estimate_codec
+from pricing_catalog import pricing_catalog
+from pricing_snapshots import compact_estimate_data, hydrate_estimate_data, pricing_snapshots
+
+# Estimates parsed before each batch of multi-row INSERTs
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+# Columns written by an export and read by an import (id is not imported)
+EXPORT_FIELDS = (
+    'id', 'project_name', 'plot_length', 'plot_breadth', 'total_area',
+    'num_floors', 'material_quality', 'total_cost', 'cost_per_sqft', 'pricing_snapshot_id',
+    'created_at'
+)
+
+REQUIRED_FIELDS = ('plot_length', 'plot_breadth', 'total_area', 'num_floors', 'total_cost')
+
+_INSERT = """INSERT INTO estimates
+    (user_id, project_name, plot_length, plot_breadth, total_area, num_floors, material_quality,
+    total_cost, cost_per_sqft, estimate_blob, pricing_snapshot_id, created_at, data_edited)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE)"""
+
+
+class EstimateImportError(ValueError):
+    """Raised for an import record that can't be stored; line is 1-based"""
+
+    def __init__(self, line, message):
+        super().__init__(f'Line {line}: {message}')
+        self.line = line
+
+
+def export_query(user_id, include_data=True):
+    """Get the SELECT streaming a user's estimates, oldest first"""
+    columns = list(EXPORT_FIELDS)
+    if include_data:
+        columns += ['estimate_blob', 'estimate_data']
+    return (f"SELECT {', '.join(columns)} FROM estimates WHERE user_id = %s "
+            f"ORDER BY created_at, id", (user_id,))
+
+
+def export_rows(rows, include_data=True, data_as_text=False):
+    """Decode streamed estimate rows into export records, one at a time
+
+    data_as_text serializes estimate_data to a JSON string, for CSV.
+    """
+    for row in rows:
+        if include_data:
+            estimate_codec.decode_row(row)
+            if row.get('pricing_snapshot_id'):
+                document = pricing_snapshots.load(row['pricing_snapshot_id'])
+                row['estimate_data'] = hydrate_estimate_data(row['estimate_data'], document)
+            if data_as_text:
+                row['estimate_data'] = json.dumps(row['estimate_data'], separators=(',', ':'), default=str)
+        yield row
+
+
+def parse_ndjson(lines):
+    """Yield (line number, record) from newline-delimited JSON lines"""
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise EstimateImportError(number, f'Invalid JSON ({e})')
+        if not isinstance(record, dict):
+            raise EstimateImportError(number, 'Expected a JSON object')
+        yield number, record
+
+
+def parse_csv(lines):
+    """Yield (line number, record) from CSV lines with a header row
+
+    Empty cells are None and the estimate_data column holds JSON.
+    """
+    def text():
+        for line in lines:
+            yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+    reader = csv.DictReader(text())
+    for record in reader:
+        number = reader.line_num
+        record = {key: (value if value != '' else None) for key, value in record.items() if key}
+        if record.get('estimate_data'):
+            try:
+                record['estimate_data'] = json.loads(record['estimate_data'])
+            except ValueError as e:
+                raise EstimateImportError(number, f'Invalid estimate_data JSON ({e})')
+        yield number, record
+
+
+def _decimal(value):
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'{value!r} is not a number')
+
+
+def _timestamp(value):
+    """Parse an exported created_at (CSV or JSON form) to a DB timestamp string"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value))
+        except ValueError:
+            try:
+                parsed = parsedate_to_datetime(str(value))
+            except (TypeError, ValueError):
+                raise ValueError(f'{value!r} is not a timestamp')
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class EstimateImporter:
+    """Insert a stream of estimate records for one user.
+
+    Records are converted as they are read and inserted IMPORT_BATCH_SIZE
+    at a time with multi-row INSERTs, so memory doesn't grow with the
+    upload. Everything runs in one transaction: a bad record rolls back
+    the whole import, and a file can simply be fixed and sent again.
+    Exported ids are ignored; created_at is kept when present. Imported
+    estimates are marked data_edited, so re-pricing leaves them as they are.
+    """
+
+    def __init__(self, database, user_id, batch_size=None):
+        self.db = database
+        self.user_id = user_id
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self._documents = {}
+        self.imported = 0
+
+    def _document(self, snapshot_id):
+        if snapshot_id not in self._documents:
+            self._documents[snapshot_id] = pricing_catalog.stored_document(snapshot_id)
+        return self._documents[snapshot_id]
+
+    def _row(self, number, record, now):
+        missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+        if missing:
+            raise EstimateImportError(number, f'Missing required fields: {", ".join(missing)}')
+        try:
+            num_floors = int(record['num_floors'])
+            plot_length, plot_breadth, total_area, total_cost, cost_per_sqft = (
+                _decimal(record.get(field)) for field in
+                ('plot_length', 'plot_breadth', 'total_area', 'total_cost', 'cost_per_sqft')
+            )
+            created_at = _timestamp(record['created_at']) if record.get('created_at') else now
+        except ValueError as e:
+            raise EstimateImportError(number, str(e))
+
+        # Records without a snapshot, or from another install referencing
+        # snapshots unknown here, carry full rates, so keep them uncompacted
+        snapshot_id = record.get('pricing_snapshot_id')
+        document = self._document(snapshot_id) if snapshot_id else None
+        estimate_data = record.get('estimate_data') or {}
+        if document is None:
+            snapshot_id = None
+        else:
+            estimate_data = compact_estimate_data(estimate_data, document)
+        return (self.user_id, record.get('project_name') or 'Untitled Project',
+                plot_length, plot_breadth, total_area, num_floors,
+                record.get('material_quality') or 'standard', total_cost, cost_per_sqft,
+                estimate_codec.encode(estimate_data), snapshot_id, created_at)
+
+    def _insert(self, tx, batch, rollups):
+        tx.execute_many(_INSERT, batch)
+        for row in batch:
+            rollups.add({'material_quality': row[6], 'num_floors': row[5],
+                         'cost_per_sqft': row[8], 'created_at': row[11]})
+        self.imported += len(batch)
+
+    def run(self, records):
+        """Import (line number, record) pairs; returns the number imported"""
+        with self.db.transaction() as tx:
+            # Rows without a created_at get the same time as the DB default would
+            now = _timestamp(tx.execute("SELECT CURRENT_TIMESTAMP AS now", fetch_one=True)['now'])
+            # Rollup changes are summed over the whole import and written once
+            rollups = RollupDelta()
+            batch = []
+            for number, record in records:
+                batch.append(self._row(number, record, now))
+                if len(batch) >= self.batch_size:
+                    self._insert(tx, batch, rollups)
+                    batch = []
+            if batch:
+                self._insert(tx, batch, rollups)
+
+            rollups.write(tx)
+            if self.imported:
+                tx.execute(
+                    """INSERT INTO estimate_markers (user_id, version) VALUES (%s, 1)
+                    ON DUPLICATE KEY UPDATE version = version + 1""",
+                    (self.user_id,)
+                )
+        return self.imported
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Import or export a user's estimates as NDJSON or CSV")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--file', help='file to read or write (default: stdin / stdout)')
+    parser.add_argument('--batch-size', type=int, help='estimates per batch of INSERTs')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        query, params = export_query(args.user_id)
+        rows = db.stream_query(query, params, primary=True)
+        if rows is None:
+            return 1
+        out = open(args.file, 'w', newline='') if args.file else sys.stdout
+        try:
+            records = export_rows(rows, data_as_text=args.format == 'csv')
+            if args.format == 'csv':
+                writer = csv.writer(out)
+                columns = list(EXPORT_FIELDS) + ['estimate_data']
+                writer.writerow(columns)
+                for record in records:
+                    writer.writerow(['' if record.get(c) is None else record.get(c) for c in columns])
+            else:
+                for record in records:
+                    out.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
+        finally:
+            rows.close()
+            if args.file:
+                out.close()
+        return 0
+
+    started = time.perf_counter()
+    source = open(args.file, 'rb') if args.file else sys.stdin.buffer
+    try:
+        records = parse_csv(source) if args.format == 'csv' else parse_ndjson(source)
+        imported = EstimateImporter(db, args.user_id, args.batch_size).run(records)
+    except EstimateImportError as e:
+        print(f"Import failed, nothing imported: {e}")
+        return 1
+    finally:
+        if args.file:
+            source.close()
+    print(f"Imported {imported} estimates in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
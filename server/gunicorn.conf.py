@@ -0,0 +1,44 @@
+# Gunicorn configuration for the Construction Cost Estimation API
+#
+# Run from the server directory:
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Connection sizing: every worker process owns its own pool, so the
+# database must accept
+#
+#   workers x (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)
+#
+# connections from each app server, plus headroom for admin tools and
+# other app servers. Keep the sum across all boxes below MySQL's
+# max_connections (DB_MAX_CONNECTIONS here, 151 by default).
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+# Load the app once in the master and fork workers from it. Database pools
+# are created lazily in each worker and reset by an at-fork hook, so no
+# connection is shared between processes.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+def when_ready(server):
+    from database import db
+    
+    # Don't carry connections opened during preload into the workers
+    db.dispose()
+    
+    per_worker = db.pool_options['size'] + db.pool_options['max_overflow']
+    required = workers * per_worker
+    max_connections = int(os.getenv('DB_MAX_CONNECTIONS', 151))
+    server.log.info(
+        f"Database connections: {workers} workers x {per_worker} per pool = {required} "
+        f"(max_connections {max_connections})"
+    )
+    if required > max_connections:
+        server.log.warning(
+            "Worker pools can open more connections than the database allows; "
+            "lower WEB_CONCURRENCY, DB_POOL_SIZE or DB_POOL_MAX_OVERFLOW"
+        )
@@ -0,0 +1,333 @@
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from database import db
+
+# Threads per worker process running jobs
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Unfinished jobs a user may have at once
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 10))
+
+# Finished jobs and their results are deleted after this many seconds
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 24 * 3600))
+
+# A job unfinished after this many seconds is reported as failed
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 3600))
+
+# The process holding a job refreshes its heartbeat several times per
+# lease; a job whose heartbeat is older than this many seconds is reported
+# as lost (its worker process exited or was restarted) and frees its slot
+JOB_LEASE = int(os.getenv('JOB_LEASE', 60))
+HEARTBEAT_INTERVAL = JOB_LEASE / 4
+
+LOST_ERROR = 'Job was lost before finishing'
+
+# Compressed bytes collected before a result chunk is written
+RESULT_CHUNK_BYTES = 1024 * 1024
+
+# Largest piece of a result decompressed at a time when serving it
+RESULT_READ_BYTES = 64 * 1024
+
+# Requests that can run as jobs: (method, path pattern)
+JOB_ENDPOINTS = [
+    ('POST', re.compile(r'^/api/calculators/construction-cost/(batch|sweep|simulate)$')),
+    ('GET', re.compile(r'^/api/estimates/export$')),
+    ('GET', re.compile(r'^/api/estimates/\d+/report$')),
+]
+
+PENDING_STATUSES = ('queued', 'running')
+
+STATUS_FIELDS = (
+    'id', 'method', 'path', 'status', 'version', 'result_status', 'result_type',
+    'result_bytes', 'error', 'created_at', 'started_at', 'finished_at'
+)
+
+
+def job_endpoint_allowed(method, path):
+    """Check a request may be submitted as a job"""
+    return any(method == allowed and pattern.match(path) for allowed, pattern in JOB_ENDPOINTS)
+
+
+class JobQueueFull(Exception):
+    """Raised when a user already has JOB_MAX_PENDING unfinished jobs"""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Ids of the jobs queued or running in this process, and the thread
+# refreshing their heartbeats
+_local_jobs = set()
+_heartbeat = None
+
+
+def _reset_executor_after_fork():
+    global _executor, _executor_lock, _local_jobs, _heartbeat
+    # The parent's threads and jobs don't exist in the child
+    _executor = None
+    _executor_lock = threading.Lock()
+    _local_jobs = set()
+    _heartbeat = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+        return _executor
+
+
+def _start_heartbeat(target):
+    global _heartbeat
+    with _executor_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=target, name='job-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+class JobRunner:
+    """Run slow API requests in the background and keep their results.
+
+    A job is an API request (one of JOB_ENDPOINTS) replayed through the
+    app on a thread of this process, so long computations don't hold a
+    request worker and get exactly the validation and output of the
+    synchronous endpoint. Job state is kept in the jobs table and the
+    zlib-compressed response in job_result_chunks, written a chunk at a
+    time as the response streams, so any worker process can answer a
+    poll and large exports or reports never sit whole in memory.
+
+    Jobs live only as long as the process running them, which refreshes
+    their heartbeat_at while they are queued or running. A job whose
+    heartbeat stops for JOB_LEASE seconds is marked failed when its user
+    submits or polls, so a restart doesn't hold the user's pending slots.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def submit(self, app, user_id, method, path, body=None, query=None):
+        """Queue a request as a job for a user; returns the job id"""
+        self._cleanup()
+        job_id = uuid.uuid4().hex
+        with self.db.transaction() as tx:
+            # Count and insert under locks so concurrent submits can't pass
+            # the limit: the user's row serializes them even when there are
+            # no unfinished jobs to lock yet
+            tx.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,), fetch_one=True)
+            self._expire_lost(tx, user_id)
+            pending = tx.execute(
+                "SELECT id FROM jobs WHERE user_id = %s AND status IN ('queued', 'running') FOR UPDATE",
+                (user_id,),
+                fetch=True
+            )
+            if len(pending) >= JOB_MAX_PENDING:
+                raise JobQueueFull(f'At most {JOB_MAX_PENDING} unfinished jobs are allowed')
+            now = datetime.now()
+            tx.execute(
+                """INSERT INTO jobs (id, user_id, method, path, status, version, created_at, heartbeat_at)
+                VALUES (%s, %s, %s, %s, 'queued', 1, %s, %s)""",
+                (job_id, user_id, method, path, now, now)
+            )
+        with _executor_lock:
+            _local_jobs.add(job_id)
+        _start_heartbeat(self._heartbeat_loop)
+        _get_executor().submit(self._run, app, job_id, user_id, method, path, body, query)
+        return job_id
+
+    def _expire_lost(self, tx, user_id):
+        """Fail a user's unfinished jobs whose process stopped running them"""
+        now = datetime.now()
+        tx.execute(
+            """UPDATE jobs SET status = 'failed', error = %s, finished_at = %s, version = version + 1
+            WHERE user_id = %s AND status IN ('queued', 'running')
+            AND (heartbeat_at < %s OR created_at < %s)""",
+            (LOST_ERROR, now, user_id, now - timedelta(seconds=JOB_LEASE),
+             now - timedelta(seconds=JOB_TIMEOUT))
+        )
+
+    def _heartbeat_loop(self):
+        """Refresh the heartbeat of this process's jobs until it exits"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with _executor_lock:
+                job_ids = list(_local_jobs)
+            if not job_ids:
+                continue
+            try:
+                with self.db.transaction() as tx:
+                    tx.execute(
+                        f"""UPDATE jobs SET heartbeat_at = %s
+                        WHERE id IN ({', '.join(['%s'] * len(job_ids))})
+                        AND status IN ('queued', 'running')""",
+                        (datetime.now(), *job_ids)
+                    )
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+
+    def _update(self, job_id, assignments, params):
+        with self.db.transaction() as tx:
+            tx.execute(
+                f"UPDATE jobs SET {assignments}, version = version + 1 WHERE id = %s",
+                tuple(params) + (job_id,)
+            )
+
+    def _store_chunk(self, job_id, seq, data):
+        with self.db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO job_result_chunks (job_id, seq, data) VALUES (%s, %s, %s)",
+                (job_id, seq, data)
+            )
+
+    def _fail(self, job_id, error):
+        with self.db.transaction() as tx:
+            tx.execute("DELETE FROM job_result_chunks WHERE job_id = %s", (job_id,))
+            tx.execute(
+                """UPDATE jobs SET status = 'failed', error = %s, result_status = NULL,
+                result_chunks = NULL, finished_at = %s, version = version + 1 WHERE id = %s""",
+                (error, datetime.now(), job_id)
+            )
+
+    def _run(self, app, job_id, user_id, method, path, body, query):
+        try:
+            now = datetime.now()
+            self._update(job_id, "status = 'running', started_at = %s, heartbeat_at = %s", (now, now))
+
+            # user_id is the submitting request's JWT identity, passed on
+            # unchanged so the replay sees the same type routes/auth.py issues
+            with app.app_context():
+                token = create_access_token(identity=user_id)
+            response = app.test_client().open(
+                path,
+                method=method,
+                json=body,
+                query_string=query,
+                headers={'Authorization': f'Bearer {token}'},
+                buffered=False
+            )
+
+            # Compress the response as it streams out of the endpoint and
+            # store it RESULT_CHUNK_BYTES at a time
+            compressor = zlib.compressobj()
+            parts = []
+            buffered = 0
+            chunks = 0
+            size = 0
+            try:
+                for chunk in response.response:
+                    chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    size += len(chunk)
+                    data = compressor.compress(chunk)
+                    parts.append(data)
+                    buffered += len(data)
+                    if buffered >= RESULT_CHUNK_BYTES:
+                        self._store_chunk(job_id, chunks, b''.join(parts))
+                        chunks += 1
+                        parts = []
+                        buffered = 0
+            finally:
+                response.close()
+            parts.append(compressor.flush())
+            self._store_chunk(job_id, chunks, b''.join(parts))
+            chunks += 1
+
+            status = 'completed' if response.status_code < 400 else 'failed'
+            error = None if status == 'completed' else f'Request failed with status {response.status_code}'
+            self._update(
+                job_id,
+                """status = %s, result_status = %s, result_type = %s, result_chunks = %s,
+                result_bytes = %s, error = %s, finished_at = %s""",
+                (status, response.status_code, response.content_type, chunks,
+                 size, error, datetime.now())
+            )
+        except Exception as e:
+            print(f"Job {job_id} error: {e}")
+            try:
+                self._fail(job_id, 'Internal server error')
+            except Exception as update_error:
+                print(f"Job {job_id} status update error: {update_error}")
+        finally:
+            with _executor_lock:
+                _local_jobs.discard(job_id)
+
+    def status(self, job_id, user_id):
+        """Get a user's job without its result, or None"""
+        job = self.db.execute_query(
+            f"SELECT {', '.join(STATUS_FIELDS)}, heartbeat_at FROM jobs WHERE id = %s AND user_id = %s",
+            (job_id, user_id),
+            fetch_one=True,
+            primary=True
+        )
+        if not job:
+            return job
+        now = datetime.now()
+        if job['status'] in PENDING_STATUSES and (
+                (job['heartbeat_at'] or job['created_at']) < now - timedelta(seconds=JOB_LEASE) or
+                job['created_at'] < now - timedelta(seconds=JOB_TIMEOUT)):
+            with self.db.transaction() as tx:
+                self._expire_lost(tx, user_id)
+            return self.status(job_id, user_id)
+        del job['heartbeat_at']
+        return job
+
+    def result(self, job_id, user_id):
+        """Get a user's job with its result chunk count, or None"""
+        return self.db.execute_query(
+            f"""SELECT {', '.join(STATUS_FIELDS)}, result_chunks FROM jobs
+            WHERE id = %s AND user_id = %s""",
+            (job_id, user_id),
+            fetch_one=True,
+            primary=True
+        )
+
+    def recent(self, user_id, limit=50):
+        """Get a user's most recent jobs, newest first"""
+        return self.db.execute_query(
+            f"""SELECT {', '.join(STATUS_FIELDS)} FROM jobs WHERE user_id = %s
+            ORDER BY created_at DESC LIMIT %s""",
+            (user_id, limit),
+            fetch=True,
+            primary=True
+        )
+
+    def _cleanup(self):
+        """Delete finished jobs older than JOB_RESULT_TTL"""
+        self.db.execute_query(
+            "DELETE FROM jobs WHERE finished_at < %s",
+            (datetime.now() - timedelta(seconds=JOB_RESULT_TTL),)
+        )
+
+    def iter_result(self, job_id, chunks):
+        """Decompress a stored job result, reading one chunk row at a time"""
+        decompressor = zlib.decompressobj()
+        for seq in range(chunks):
+            row = self.db.execute_query(
+                "SELECT data FROM job_result_chunks WHERE job_id = %s AND seq = %s",
+                (job_id, seq),
+                fetch_one=True,
+                primary=True
+            )
+            if row is None:
+                raise RuntimeError(f'Result chunk {seq} of job {job_id} is missing')
+            data = decompressor.decompress(bytes(row['data']), RESULT_READ_BYTES)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, RESULT_READ_BYTES)
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+# Create a global job runner
+jobs = JobRunner(db)
@@ -0,0 +1,143 @@
+import copy
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class JsonPatchError(ValueError):
+    """Raised for a malformed patch document"""
+
+
+class JsonPatchConflict(JsonPatchError):
+    """Raised when a patch does not apply to the target document"""
+
+
+def parse_pointer(pointer):
+    """Split a JSON Pointer (RFC 6901) into its reference tokens"""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JsonPatchError(f'Invalid JSON pointer: {pointer!r}')
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def validate_patch(operations, max_operations=None):
+    """Check a patch is a list of well-formed operations"""
+    if not isinstance(operations, list):
+        raise JsonPatchError('Patch must be a list of operations')
+    if max_operations is not None and len(operations) > max_operations:
+        raise JsonPatchError(f'Patch has more than {max_operations} operations')
+
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise JsonPatchError(f'Operation {i} must be an object')
+        op = operation.get('op')
+        if op not in OPERATIONS:
+            raise JsonPatchError(f'Operation {i} has unknown op {op!r}')
+        parse_pointer(operation.get('path'))
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f'Operation {i} ({op}) requires a value')
+        if op in ('move', 'copy'):
+            parse_pointer(operation.get('from'))
+
+
+def _index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchConflict(f'Invalid array index {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchConflict(f'Array index {index} out of range')
+    return index
+
+
+def _resolve(document, tokens):
+    """Get the container holding the last token"""
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise JsonPatchConflict(f'Path member {token!r} not found')
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_index(target, token)]
+        else:
+            raise JsonPatchConflict(f'Cannot traverse into {type(target).__name__}')
+    return target
+
+
+def _get(document, tokens):
+    if not tokens:
+        return document
+    container = _resolve(document, tokens)
+    key = tokens[-1]
+    if isinstance(container, dict):
+        if key not in container:
+            raise JsonPatchConflict(f'Path member {key!r} not found')
+        return container[key]
+    if isinstance(container, list):
+        return container[_index(container, key)]
+    raise JsonPatchConflict(f'Cannot traverse into {type(container).__name__}')
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    container = _resolve(document, tokens)
+    key = tokens[-1]
+    if isinstance(container, dict):
+        container[key] = value
+    elif isinstance(container, list):
+        container.insert(_index(container, key, allow_end=True), value)
+    else:
+        raise JsonPatchConflict(f'Cannot add to {type(container).__name__}')
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JsonPatchConflict('Cannot remove the whole document')
+    container = _resolve(document, tokens)
+    key = tokens[-1]
+    if isinstance(container, dict):
+        if key not in container:
+            raise JsonPatchConflict(f'Path member {key!r} not found')
+        return container.pop(key)
+    if isinstance(container, list):
+        return container.pop(_index(container, key))
+    raise JsonPatchConflict(f'Cannot remove from {type(container).__name__}')
+
+
+def apply_patch(document, operations):
+    """Apply RFC 6902 operations to a document, returning the result
+
+    The document is modified in place where possible; callers discard it
+    if a JsonPatchConflict is raised part way through.
+    """
+    for operation in operations:
+        op = operation['op']
+        tokens = parse_pointer(operation['path'])
+
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            _get(document, tokens)
+            if tokens:
+                _remove(document, tokens)
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            source = parse_pointer(operation['from'])
+            if tokens[:len(source)] == source and tokens != source:
+                raise JsonPatchConflict('Cannot move a value into one of its children')
+            value = _remove(document, source) if source else document
+            document = _add(document, tokens, value)
+        elif op == 'copy':
+            value = copy.deepcopy(_get(document, parse_pointer(operation['from'])))
+            document = _add(document, tokens, value)
+        elif op == 'test':
+            if _get(document, tokens) != operation['value']:
+                raise JsonPatchConflict(f"Test failed at {operation['path']!r}")
+
+    return document
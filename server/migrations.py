@@ -0,0 +1,300 @@
+"""Versioned schema migrations
+
+Each migration is (version, name, statements). Applied versions are
+recorded in the schema_migrations table and pending ones run in order.
+Never edit a migration that has shipped; add a new one instead.
+
+Usage (from the server directory):
+    python migrations.py             apply pending migrations
+    python migrations.py --dry-run   print pending migrations without applying
+    python migrations.py --status    list applied and pending versions
+"""
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        # Users table
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+
+        # Material prices table
+        """
+        CREATE TABLE IF NOT EXISTS material_prices (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            material_name VARCHAR(100) NOT NULL,
+            unit VARCHAR(20) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            quality VARCHAR(50) DEFAULT 'standard',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+
+        # Labor rates table
+        """
+        CREATE TABLE IF NOT EXISTS labor_rates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            labor_type VARCHAR(100) NOT NULL,
+            rate DECIMAL(10, 2) NOT NULL,
+            unit VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+
+        # Estimates table
+        """
+        CREATE TABLE IF NOT EXISTS estimates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT,
+            project_name VARCHAR(200),
+            plot_length DECIMAL(10, 2),
+            plot_breadth DECIMAL(10, 2),
+            total_area DECIMAL(10, 2),
+            num_floors INT,
+            material_quality VARCHAR(50),
+            total_cost DECIMAL(15, 2),
+            cost_per_sqft DECIMAL(10, 2),
+            estimate_data JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+
+        # Consumption ratios table
+        """
+        CREATE TABLE IF NOT EXISTS consumption_ratios (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            material_name VARCHAR(100) NOT NULL,
+            ratio_per_sqft DECIMAL(10, 4) NOT NULL,
+            unit VARCHAR(20) NOT NULL,
+            category VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+
+        # Per-user change counter for estimates (drives list ETags)
+        """
+        CREATE TABLE IF NOT EXISTS estimate_markers (
+            user_id INT PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """
+    ]),
+
+    # Indexes matched to the per-request query shapes. users.username and
+    # users.email already have UNIQUE indexes, which MySQL combines with an
+    # index merge for the login/register "username = %s OR email = %s" lookup.
+    (2, 'indexes for hot queries', [
+        # Estimates list: WHERE user_id = %s ORDER BY created_at DESC, id DESC
+        "CREATE INDEX idx_estimates_user_created ON estimates (user_id, created_at, id)",
+        # Price lookups by material name and quality
+        "CREATE INDEX idx_material_prices_name_quality ON material_prices (material_name, quality)",
+        # Consumption ratios filtered by category
+        "CREATE INDEX idx_consumption_ratios_category ON consumption_ratios (category)",
+    ]),
+
+    # Compressed estimate_data (see estimate_store.py). Old rows keep their
+    # JSON in estimate_data until rewritten.
+    (3, 'compressed estimate data', [
+        "ALTER TABLE estimates ADD COLUMN estimate_blob LONGBLOB",
+    ]),
+
+    # Content-addressed pricing snapshots referenced by estimates (see
+    # pricing_snapshots.py). Snapshots are immutable and never deleted.
+    (4, 'pricing snapshots', [
+        """
+        CREATE TABLE IF NOT EXISTS pricing_snapshots (
+            id CHAR(64) PRIMARY KEY,
+            snapshot_data LONGBLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE estimates ADD COLUMN pricing_snapshot_id CHAR(64)",
+        "CREATE INDEX idx_estimates_pricing_snapshot ON estimates (pricing_snapshot_id)",
+    ]),
+
+    # cost_per_sqft rollups for the analytics endpoint (see cost_rollups.py),
+    # maintained on every estimate write. Fill them for existing estimates
+    # with: python cost_rollups.py
+    (5, 'cost analytics rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS estimate_rollups (
+            month CHAR(7) NOT NULL,
+            material_quality VARCHAR(50) NOT NULL,
+            num_floors INT NOT NULL,
+            estimate_count INT NOT NULL DEFAULT 0,
+            cost_per_sqft_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+            cost_per_sqft_sq_sum DECIMAL(30, 4) NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, material_quality, num_floors)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS estimate_rollup_buckets (
+            month CHAR(7) NOT NULL,
+            material_quality VARCHAR(50) NOT NULL,
+            num_floors INT NOT NULL,
+            bucket INT NOT NULL,
+            estimate_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, material_quality, num_floors, bucket)
+        )
+        """,
+    ]),
+
+    # Background jobs (see jobs.py). Rows are shared by all worker
+    # processes so any of them can answer a poll; results are stored as a
+    # sequence of zlib chunks written as the replayed response streams.
+    (6, 'background jobs', [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id CHAR(32) PRIMARY KEY,
+            user_id INT,
+            method VARCHAR(10) NOT NULL,
+            path VARCHAR(200) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            version INT NOT NULL DEFAULT 1,
+            result_status INT,
+            result_type VARCHAR(100),
+            result_chunks INT,
+            result_bytes BIGINT,
+            error TEXT,
+            created_at TIMESTAMP NULL,
+            started_at TIMESTAMP NULL,
+            heartbeat_at TIMESTAMP NULL,
+            finished_at TIMESTAMP NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS job_result_chunks (
+            job_id CHAR(32) NOT NULL,
+            seq INT NOT NULL,
+            data LONGBLOB NOT NULL,
+            PRIMARY KEY (job_id, seq),
+            FOREIGN KEY (job_id) REFERENCES jobs(id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX idx_jobs_user_created ON jobs (user_id, created_at)",
+        "CREATE INDEX idx_jobs_finished ON jobs (finished_at)",
+    ]),
+
+    # Estimates whose estimate_data didn't come straight from the cost
+    # calculator: edited through PUT or PATCH, imported, or found by
+    # re-pricing not to match their snapshot. Re-pricing leaves them alone.
+    (7, 'edited estimates', [
+        "ALTER TABLE estimates ADD COLUMN data_edited BOOLEAN NOT NULL DEFAULT FALSE",
+    ]),
+
+    # Pricing catalog version shared by all processes (see
+    # pricing_catalog.py); price changes bump it so every process reloads
+    (8, 'shared pricing catalog version', [
+        """
+        CREATE TABLE IF NOT EXISTS pricing_catalog_version (
+            id INT PRIMARY KEY,
+            version INT NOT NULL
+        )
+        """,
+        """INSERT INTO pricing_catalog_version (id, version) VALUES (1, 0)
+        ON DUPLICATE KEY UPDATE id = id""",
+    ]),
+]
+
+SCHEMA_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def applied_versions(db, create=True):
+    """Get the set of migration versions already applied
+
+    With create=False nothing is written: a database without the
+    schema_migrations table is treated as having no migrations applied.
+    """
+    try:
+        with db.transaction() as tx:
+            if create:
+                tx.execute(SCHEMA_MIGRATIONS_TABLE)
+            rows = tx.execute("SELECT version FROM schema_migrations", fetch=True)
+    except Exception:
+        if create:
+            raise
+        return set()
+    return {row['version'] for row in rows}
+
+
+def pending_migrations(db, create=True):
+    """Get the migrations not yet applied, in version order"""
+    applied = applied_versions(db, create)
+    return [m for m in sorted(MIGRATIONS) if m[0] not in applied]
+
+
+def migrate(db, dry_run=False, target=None, out=print):
+    """Apply pending migrations up to target (default: latest)
+
+    With dry_run the SQL is printed and nothing is executed. Each
+    migration is recorded in the same transaction as its statements; note
+    that MySQL commits DDL implicitly, so a migration failing halfway must
+    be fixed forward.
+    """
+    applied = []
+    for version, name, statements in pending_migrations(db, create=not dry_run):
+        if target is not None and version > target:
+            break
+
+        out(f"{'Would apply' if dry_run else 'Applying'} migration {version}: {name}")
+        if dry_run:
+            for statement in statements:
+                out('    ' + ' '.join(statement.split()) + ';')
+            applied.append(version)
+            continue
+
+        with db.transaction() as tx:
+            for statement in statements:
+                tx.execute(statement)
+            tx.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+        applied.append(version)
+
+    if not applied:
+        out("Database schema is up to date")
+    return applied
+
+
+def main(argv=None):
+    import argparse
+    from database import db
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--dry-run', action='store_true', help='print pending migrations without applying them')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations')
+    parser.add_argument('--target', type=int, help='migrate up to this version only')
+    args = parser.parse_args(argv)
+
+    if args.status:
+        applied = applied_versions(db, create=False)
+        for version, name, _ in sorted(MIGRATIONS):
+            print(f"{'[x]' if version in applied else '[ ]'} {version}: {name}")
+        return 0
+
+    migrate(db, dry_run=args.dry_run, target=args.target)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,72 @@
+from flask import g
+from database import db
+
+
+class PriceResolver:
+    """Batch material price lookups into a single query.
+
+    Callers prime the (material_name, quality) keys they need, then load
+    them; all pending keys are resolved together with one
+    `material_name IN (...)` query and remembered for the rest of the
+    request. A quality of None matches the first price row for the
+    material in any quality.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self._prices = {}
+        self._pending = set()
+        self.queries = 0
+
+    def prime(self, keys):
+        """Queue keys to be resolved by the next dispatch"""
+        for key in keys:
+            if key not in self._prices:
+                self._pending.add(key)
+
+    def dispatch(self):
+        """Resolve all pending keys with one query"""
+        if not self._pending:
+            return
+
+        pending = self._pending
+        self._pending = set()
+        names = sorted({name for name, _ in pending})
+        placeholders = ', '.join(['%s'] * len(names))
+
+        rows = self.db.execute_query(
+            f"SELECT material_name, quality, price FROM material_prices "
+            f"WHERE material_name IN ({placeholders}) ORDER BY id",
+            tuple(names),
+            fetch=True
+        )
+        self.queries += 1
+
+        if rows is None:
+            raise RuntimeError('Failed to load material prices')
+
+        for name, quality in pending:
+            row = next(
+                (r for r in rows
+                 if r['material_name'] == name and (quality is None or r['quality'] == quality)),
+                None
+            )
+            self._prices[(name, quality)] = float(row['price']) if row else None
+
+    def load_many(self, keys):
+        """Get prices for several keys, None where no price exists"""
+        keys = list(keys)
+        self.prime(keys)
+        self.dispatch()
+        return [self._prices[key] for key in keys]
+
+    def load(self, material_name, quality=None):
+        """Get the price for one material"""
+        return self.load_many([(material_name, quality)])[0]
+
+
+def get_price_resolver():
+    """Get the price resolver for the current request"""
+    if 'price_resolver' not in g:
+        g.price_resolver = PriceResolver(db)
+    return g.price_resolver
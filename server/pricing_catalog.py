@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from types import MappingProxyType
+from database import db
+from cost_plan import CostPlan
+from pricing_snapshots import document_id, pricing_document, pricing_snapshots
+
+
+class CatalogSnapshot:
+    """Immutable view of the pricing tables at one catalog version"""
+
+    __slots__ = ('version', 'loaded_at', 'materials', 'materials_by_quality',
+                 'consumption_ratios', 'labor_rates', 'cost_plans', 'snapshot_id')
+
+    def __init__(self, version, materials, consumption_ratios, labor_rates):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'loaded_at', time.monotonic())
+        object.__setattr__(self, 'materials', _freeze_rows(materials))
+        object.__setattr__(self, 'consumption_ratios', _freeze_rows(consumption_ratios))
+        object.__setattr__(self, 'labor_rates', _freeze_rows(labor_rates))
+        object.__setattr__(self, 'snapshot_id', document_id(
+            pricing_document(self.materials, self.consumption_ratios, self.labor_rates)
+        ))
+
+        by_quality = {}
+        for material in self.materials:
+            by_quality.setdefault(material['quality'], []).append(material)
+        object.__setattr__(self, 'materials_by_quality', MappingProxyType(
+            {quality: tuple(rows) for quality, rows in by_quality.items()}
+        ))
+        object.__setattr__(self, 'cost_plans', MappingProxyType(
+            {quality: CostPlan.compile(self, quality) for quality in by_quality}
+        ))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CatalogSnapshot is immutable')
+
+    def materials_for(self, quality):
+        """Get the material price rows for a quality level"""
+        return self.materials_by_quality.get(quality, ())
+
+    def cost_plan(self, quality):
+        """Get the compiled cost plan for a quality level"""
+        plan = self.cost_plans.get(quality)
+        if plan is None:
+            # Unknown quality: no material prices, labor only. Not stored so
+            # arbitrary client input cannot grow the snapshot.
+            plan = CostPlan.compile(self, quality)
+        return plan
+
+
+def _freeze_rows(rows):
+    return tuple(MappingProxyType(dict(row)) for row in rows)
+
+
+class PricingCatalog:
+    """In-process cache of the pricing tables.
+
+    Readers get the current snapshot without touching the database. The
+    catalog version is shared by all processes in the pricing_catalog_version
+    table: the write endpoints bump it, and each process checks it at most
+    every PRICING_VERSION_POLL seconds, reloading its snapshot when it has
+    moved on or the snapshot is older than the TTL. Reloads run one at a
+    time but outside the lock that invalidate() and version checks take, so
+    a slow reload doesn't hold up a price change.
+    """
+
+    def __init__(self, database, ttl=None, poll_interval=None):
+        self.db = database
+        self.ttl = float(ttl if ttl is not None else os.getenv('PRICING_CACHE_TTL', 300))
+        self.poll_interval = float(poll_interval if poll_interval is not None
+                                   else os.getenv('PRICING_VERSION_POLL', 1))
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._version = 0
+        self._checked_at = None
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @property
+    def version(self):
+        self._poll()
+        return self._version
+
+    def _is_fresh(self, snapshot):
+        return (
+            snapshot is not None
+            and snapshot.version == self._version
+            and time.monotonic() - snapshot.loaded_at < self.ttl
+        )
+
+    def _shared_version(self):
+        row = self.db.execute_query(
+            "SELECT version FROM pricing_catalog_version WHERE id = 1",
+            fetch_one=True,
+            primary=True
+        )
+        return row['version'] if row else None
+
+    def _poll(self):
+        """Pick up version bumps made by other processes"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+                return
+            # Other threads keep the known version while this one asks
+            self._checked_at = now
+        version = self._shared_version()
+        if version is not None:
+            with self._lock:
+                self._version = max(self._version, version)
+
+    def snapshot(self):
+        """Get the current catalog snapshot, reloading it if stale"""
+        self._poll()
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            self.hits += 1
+            return snapshot
+
+        with self._reload_lock:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                self.hits += 1
+                return snapshot
+
+            self.misses += 1
+            # The version is read before the tables, so a change made while
+            # they load leaves the snapshot stale rather than mislabelled
+            snapshot = self._load(self._version)
+            with self._lock:
+                self._snapshot = snapshot
+            self.reloads += 1
+            return snapshot
+
+    def _load(self, version):
+        # Reloads follow price changes, so read from the primary rather than
+        # a replica that may not have caught up yet
+        materials = self.db.execute_query(
+            "SELECT * FROM material_prices ORDER BY id",
+            fetch=True,
+            primary=True
+        )
+        consumption_ratios = self.db.execute_query(
+            "SELECT * FROM consumption_ratios ORDER BY id",
+            fetch=True,
+            primary=True
+        )
+        labor_rates = self.db.execute_query(
+            "SELECT * FROM labor_rates ORDER BY id",
+            fetch=True,
+            primary=True
+        )
+
+        if materials is None or consumption_ratios is None or labor_rates is None:
+            raise RuntimeError('Failed to load pricing catalog')
+
+        return CatalogSnapshot(version, materials, consumption_ratios, labor_rates)
+
+    def invalidate(self):
+        """Bump the shared catalog version so every process reloads its snapshot"""
+        self.db.execute_query("UPDATE pricing_catalog_version SET version = version + 1 WHERE id = 1")
+        version = self._shared_version()
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if version is not None:
+                self._version = max(self._version, version)
+            else:
+                # The shared version couldn't be bumped; reload here at least
+                print("Error bumping pricing catalog version")
+                self._snapshot = None
+
+    def document(self, snapshot_id):
+        """Get a pricing document by id without storing anything, or None
+
+        The current prices aren't stored until an estimate references
+        them, so their document comes from the snapshot in memory.
+        """
+        document = pricing_snapshots.load(snapshot_id)
+        if document is None:
+            snapshot = self.snapshot()
+            if snapshot.snapshot_id == snapshot_id:
+                document = pricing_document(snapshot.materials, snapshot.consumption_ratios,
+                                            snapshot.labor_rates)
+        return document
+
+    def stored_document(self, snapshot_id):
+        """Get a pricing document by id for an estimate to reference, or None
+
+        Stores the current prices if they are the snapshot asked for.
+        """
+        document = pricing_snapshots.load(snapshot_id)
+        if document is None:
+            snapshot = self.snapshot()
+            if snapshot.snapshot_id == snapshot_id:
+                pricing_snapshots.ensure(snapshot)
+                document = pricing_snapshots.load(snapshot_id)
+        return document
+
+    def stats(self):
+        """Get cache counters for monitoring"""
+        snapshot = self._snapshot
+        return {
+            'version': self._version,
+            'snapshot_version': snapshot.version if snapshot else None,
+            'snapshot_age': round(time.monotonic() - snapshot.loaded_at, 3) if snapshot else None,
+            'ttl': self.ttl,
+            'poll_interval': self.poll_interval,
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads
+        }
+
+
+# Create a global pricing catalog instance
+pricing_catalog = PricingCatalog(db)
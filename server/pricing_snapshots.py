@@ -0,0 +1,175 @@
+import hashlib
+import json
+import re
+from database import db
+from estimate_store import EstimateCodec
+from result_cache import ResultCache
+
+SNAPSHOT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Set in compacted estimate_data whose rates were moved to the snapshot
+RATES_MARKER = '_rates_from_snapshot'
+
+
+def pricing_document(materials, consumption_ratios, labor_rates):
+    """Get the pricing content of a catalog, without ids or timestamps"""
+    return {
+        'materials': [
+            {'material_name': row['material_name'], 'unit': row['unit'],
+             'price': float(row['price']), 'quality': row['quality']}
+            for row in materials
+        ],
+        'consumption_ratios': [
+            {'material_name': row['material_name'], 'ratio_per_sqft': float(row['ratio_per_sqft']),
+             'unit': row['unit'], 'category': row['category']}
+            for row in consumption_ratios
+        ],
+        'labor_rates': [
+            {'labor_type': row['labor_type'], 'rate': float(row['rate']), 'unit': row['unit']}
+            for row in labor_rates
+        ]
+    }
+
+
+def document_id(document):
+    """Content address of a pricing document: SHA-256 of its canonical JSON"""
+    canonical = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _rate_index(document):
+    materials = {}
+    for row in document['materials']:
+        # First row per material and quality wins, as in CostPlan
+        materials.setdefault((row['material_name'], row['quality']), (row['price'], row['unit']))
+    labor = {row['labor_type']: row['rate'] for row in document['labor_rates']}
+    return materials, labor
+
+
+def compact_estimate_data(data, document):
+    """Drop breakdown rates that the pricing snapshot already records
+
+    Only rates equal to the snapshot's are dropped, so hydrating the result
+    gives back the original data.
+    """
+    if not isinstance(data, dict):
+        return data
+    materials, labor = _rate_index(document)
+    quality = data.get('quality', 'standard')
+    compacted = False
+
+    material_breakdown = []
+    for item in data.get('material_breakdown') or []:
+        known = materials.get((item.get('material'), quality)) if isinstance(item, dict) else None
+        if known and item.get('rate') == known[0] and item.get('unit') == known[1]:
+            item = {k: v for k, v in item.items() if k not in ('rate', 'unit')}
+            compacted = True
+        material_breakdown.append(item)
+
+    labor_breakdown = []
+    for item in data.get('labor_breakdown') or []:
+        known = labor.get(item.get('labor_type')) if isinstance(item, dict) else None
+        if known is not None and item.get('rate') == known:
+            item = {k: v for k, v in item.items() if k != 'rate'}
+            compacted = True
+        labor_breakdown.append(item)
+
+    if not compacted:
+        return data
+    data = dict(data, material_breakdown=material_breakdown, labor_breakdown=labor_breakdown)
+    data[RATES_MARKER] = True
+    return data
+
+
+def hydrate_estimate_data(data, document):
+    """Restore the rates removed by compact_estimate_data"""
+    if not isinstance(data, dict) or not data.get(RATES_MARKER):
+        return data
+    materials, labor = _rate_index(document)
+    quality = data.get('quality', 'standard')
+
+    data = dict(data)
+    del data[RATES_MARKER]
+    material_breakdown = []
+    for item in data.get('material_breakdown') or []:
+        known = materials.get((item.get('material'), quality)) if isinstance(item, dict) else None
+        if known and 'rate' not in item:
+            item = dict(item, unit=known[1], rate=known[0])
+        material_breakdown.append(item)
+
+    labor_breakdown = []
+    for item in data.get('labor_breakdown') or []:
+        known = labor.get(item.get('labor_type')) if isinstance(item, dict) else None
+        if known is not None and 'rate' not in item:
+            item = dict(item, rate=known)
+        labor_breakdown.append(item)
+
+    data['material_breakdown'] = material_breakdown
+    data['labor_breakdown'] = labor_breakdown
+    return data
+
+
+class PricingSnapshotStore:
+    """Immutable pricing snapshots stored once, addressed by content hash.
+
+    Estimates reference the snapshot they were priced with by id, so the
+    catalog isn't repeated in every estimate and historical estimates stay
+    reproducible after prices change. Two estimates priced with the same
+    catalog share a snapshot id.
+    """
+
+    def __init__(self, database, cache_size=64):
+        self.db = database
+        self.codec = EstimateCodec()
+        self._stored = set()
+        self._documents = ResultCache(cache_size, ttl=float('inf'))
+
+    def ensure(self, snapshot):
+        """Store a catalog snapshot if it isn't stored yet; returns its id"""
+        snapshot_id = snapshot.snapshot_id
+        if snapshot_id in self._stored:
+            return snapshot_id
+
+        document = pricing_document(snapshot.materials, snapshot.consumption_ratios, snapshot.labor_rates)
+        with self.db.transaction() as tx:
+            tx.execute(
+                """INSERT INTO pricing_snapshots (id, snapshot_data) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE id = id""",
+                (snapshot_id, self.codec.encode(document))
+            )
+        self._stored.add(snapshot_id)
+        self._documents.put(snapshot_id, document)
+        return snapshot_id
+
+    def load(self, snapshot_id):
+        """Get a stored pricing document, or None if there is no such snapshot"""
+        if not isinstance(snapshot_id, str) or not SNAPSHOT_ID_PATTERN.match(snapshot_id):
+            return None
+
+        document = self._documents.get(snapshot_id)
+        if document is not None:
+            return document
+
+        query = "SELECT snapshot_data FROM pricing_snapshots WHERE id = %s"
+        row = self.db.execute_query(query, (snapshot_id,), fetch_one=True)
+        if row is None:
+            # Possibly not replicated yet
+            row = self.db.execute_query(query, (snapshot_id,), fetch_one=True, primary=True)
+        if row is None:
+            return None
+
+        document = self.codec.decode(row['snapshot_data'])
+        self._documents.put(snapshot_id, document)
+        return document
+
+    def stats(self):
+        """Get cache and storage counters for monitoring"""
+        return {
+            'stored_this_process': len(self._stored),
+            'cache': self._documents.stats(),
+            'storage': self.codec.stats()
+        }
+
+
+# Create a global pricing snapshot store
+pricing_snapshots = PricingSnapshotStore(db)
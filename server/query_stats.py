@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from flask import g, has_request_context, request
+
+# Upper bounds (ms) of the per-statement latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_LOG_SIZE = int(os.getenv('SLOW_QUERY_LOG_SIZE', 100))
+
+# Requests issuing more queries than this are logged as likely N+1 patterns
+QUERY_COUNT_WARN = int(os.getenv('QUERY_COUNT_WARN', 10))
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(query):
+    """Reduce a statement to its shape: literals become ?, IN lists collapse"""
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    query = _IN_LIST.sub('IN (...)', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+class _StatementStats:
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def as_dict(self):
+        histogram = {
+            f'le_{bound}ms': count
+            for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)
+        }
+        histogram['gt_{}ms'.format(LATENCY_BUCKETS_MS[-1])] = self.buckets[-1]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'histogram': histogram
+        }
+
+
+class QueryStats:
+    """Latency statistics for every statement run through Database.
+
+    Tracks a histogram per normalized statement, query counts and DB time
+    per Flask endpoint, and a bounded log of slow queries (optionally with
+    their EXPLAIN output).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._endpoints = {}
+        self._slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record(self, query, seconds, error=False, explain=None):
+        """Record one statement execution.
+
+        `explain` is an optional callable returning EXPLAIN rows; it is
+        only called for slow queries when SLOW_QUERY_EXPLAIN is enabled.
+        """
+        ms = seconds * 1000
+        shape = normalize_sql(query)
+
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS_MS)
+
+        with self._lock:
+            stats = self._statements.get(shape)
+            if stats is None:
+                stats = self._statements[shape] = _StatementStats()
+            stats.count += 1
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.buckets[i] += 1
+            if error:
+                stats.errors += 1
+
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+            g.query_ms = g.get('query_ms', 0.0) + ms
+
+        if ms >= SLOW_QUERY_MS:
+            entry = {
+                'sql': shape,
+                'duration_ms': round(ms, 3),
+                'endpoint': request.endpoint if has_request_context() else None,
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'error': error
+            }
+            if explain is not None and SLOW_QUERY_EXPLAIN and not error:
+                try:
+                    entry['explain'] = explain()
+                except Exception as e:
+                    entry['explain_error'] = str(e)
+            print(f"Slow query ({ms:.1f} ms) in {entry['endpoint']}: {shape}")
+            with self._lock:
+                self._slow.append(entry)
+
+    def finish_request(self, endpoint):
+        """Fold the current request's query count into per-endpoint stats"""
+        count = g.get('query_count', 0)
+        ms = g.get('query_ms', 0.0)
+
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'db_ms': 0.0, 'max_queries': 0
+                }
+            stats['requests'] += 1
+            stats['queries'] += count
+            stats['db_ms'] += ms
+            stats['max_queries'] = max(stats['max_queries'], count)
+
+        if count > QUERY_COUNT_WARN:
+            print(f"Request to {endpoint} ran {count} queries ({ms:.1f} ms); possible N+1 pattern")
+
+        return count, ms
+
+    def init_app(self, app):
+        """Add per-request query count and DB time headers to responses"""
+        @app.after_request
+        def add_query_headers(response):
+            count, ms = self.finish_request(request.endpoint)
+            response.headers['X-Query-Count'] = str(count)
+            response.headers['X-Query-Time-Ms'] = f'{ms:.1f}'
+            return response
+
+    def snapshot(self, limit=50):
+        """Get the statements with the most total DB time, endpoints and slow log"""
+        with self._lock:
+            statements = sorted(
+                self._statements.items(), key=lambda item: item[1].total_ms, reverse=True
+            )[:limit]
+            endpoints = {
+                endpoint: {
+                    'requests': s['requests'],
+                    'queries': s['queries'],
+                    'queries_per_request': round(s['queries'] / s['requests'], 2),
+                    'max_queries': s['max_queries'],
+                    'db_ms': round(s['db_ms'], 3),
+                    'db_ms_per_request': round(s['db_ms'] / s['requests'], 3)
+                }
+                for endpoint, s in self._endpoints.items()
+            }
+            return {
+                'statements': [
+                    dict(sql=shape, **stats.as_dict()) for shape, stats in statements
+                ],
+                'endpoints': endpoints,
+                'slow_queries': list(self._slow),
+                'slow_query_ms': SLOW_QUERY_MS
+            }
+
+
+# Create a global query statistics instance
+query_stats = QueryStats()
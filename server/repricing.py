@@ -0,0 +1,403 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cost_rollups import cost_rollups
+from database import db
+from estimate_store import estimate_codec
+from pricing_catalog import CatalogSnapshot, pricing_catalog
+from pricing_snapshots import compact_estimate_data, hydrate_estimate_data, pricing_snapshots
+
+# Estimates re-priced per transaction
+REPRICE_BATCH_SIZE = int(os.getenv('REPRICE_BATCH_SIZE', 500))
+
+# Threads re-pricing batches in parallel, each on its own connection
+REPRICE_WORKERS = int(os.getenv('REPRICE_WORKERS', 4))
+
+# Start a re-pricing job automatically when prices change through the API
+REPRICE_ON_PRICE_CHANGE = os.getenv('REPRICE_ON_PRICE_CHANGE', 'true').lower() in ('1', 'true', 'yes')
+
+# Largest difference between a stored estimate value and the one its
+# pricing snapshot gives for it to count as unedited calculator output
+VALUE_TOLERANCE = 0.01
+
+# estimate_data keys re-pricing rebuilds; they must match the snapshot
+PRICED_KEYS = ('material_breakdown', 'labor_breakdown', 'total_material_cost',
+               'total_labor_cost', 'total_cost')
+
+
+def _plan_signature(snapshot, quality):
+    """Everything about a snapshot that affects an estimate of this quality
+
+    Covers the compiled cost plan and every rate compacted estimate_data
+    of this quality can rely on, including materials and labor types the
+    plan doesn't use.
+    """
+    plan = snapshot.cost_plan(quality)
+    prices = {}
+    for material in snapshot.materials_for(quality):
+        prices.setdefault(material['material_name'], (float(material['price']), material['unit']))
+    labor = {row['labor_type']: float(row['rate']) for row in snapshot.labor_rates}
+    return (
+        plan.materials, plan.units, tuple(plan.ratios), tuple(plan.rates),
+        plan.labor_types, tuple(plan.labor_rates),
+        tuple(sorted(prices.items())), tuple(sorted(labor.items()))
+    )
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _same_value(stored, computed):
+    """Compare stored estimate data with freshly computed data, floats to a cent"""
+    if isinstance(computed, list):
+        return (isinstance(stored, list) and len(stored) == len(computed)
+                and all(_same_value(a, b) for a, b in zip(stored, computed)))
+    if isinstance(computed, dict):
+        return (isinstance(stored, dict) and stored.keys() == computed.keys()
+                and all(_same_value(stored[key], value) for key, value in computed.items()))
+    if _is_number(computed):
+        return _is_number(stored) and abs(stored - computed) <= VALUE_TOLERANCE
+    return stored == computed
+
+
+def _is_calculator_estimate(row, estimate_data, computed):
+    """Check estimate_data is what its pricing snapshot gives for the row
+
+    computed is the row's estimate recomputed with the snapshot it was
+    priced with. Only unedited calculator output can be re-priced: its
+    breakdown is rebuilt from the plot and floors, where anything added,
+    removed or changed since would be lost.
+    """
+    if not isinstance(estimate_data, dict) or row['total_cost'] is None:
+        return False
+    return (all(_same_value(estimate_data.get(key), computed[key]) for key in PRICED_KEYS)
+            and abs(float(row['total_cost']) - computed['total_cost']) <= VALUE_TOLERANCE)
+
+
+class RepricingJob:
+    """Re-price saved estimates against the current pricing catalog.
+
+    Estimates are grouped by (pricing snapshot, quality). Groups whose
+    cost plan is unchanged in the current catalog are moved to the new
+    snapshot with a single UPDATE. The rest are re-computed with
+    CostPlan.estimate_batch in batches of REPRICE_BATCH_SIZE on a thread
+    pool, and written back with one bulk UPDATE per batch, moving them
+    between cost rollup buckets in the same transaction.
+
+    Estimates marked data_edited (changed through PUT or PATCH, or
+    imported) are never touched. Before re-pricing, each estimate is
+    recomputed with the snapshot it was priced with; one that doesn't
+    match, or has no snapshot or dimensions, is marked data_edited,
+    keeps its snapshot and is counted as skipped, so later runs don't
+    scan it again.
+    """
+
+    def __init__(self, database, batch_size=None, workers=None):
+        self.db = database
+        self.batch_size = batch_size or REPRICE_BATCH_SIZE
+        # More workers than pooled connections would only wait on the pool
+        self.workers = min(workers or REPRICE_WORKERS,
+                           database.pool_options['size'] + database.pool_options['max_overflow'])
+        self.id = uuid.uuid4().hex
+        self.status = 'pending'
+        self.error = None
+        self.snapshot_id = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self.total = 0
+        self.processed = 0
+        self.repriced = 0
+        self.relinked = 0
+        self.skipped = 0
+        self.batches = 0
+        self._old_snapshots = {}
+
+    def run(self):
+        """Run the job to completion in the calling thread"""
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            snapshot = pricing_catalog.snapshot()
+            self.snapshot_id = pricing_snapshots.ensure(snapshot)
+            ids = self._plan(snapshot)
+
+            batches = [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._reprice_batch, snapshot, batch) for batch in batches]
+                for future in as_completed(futures):
+                    future.result()
+
+            self.status = 'completed'
+        except Exception as e:
+            print(f"Re-pricing job error: {e}")
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+        return self
+
+    def _plan(self, snapshot):
+        """Relink unchanged groups and get the ids of estimates to re-price"""
+        groups = self.db.execute_query(
+            """SELECT pricing_snapshot_id, material_quality, COUNT(*) AS count FROM estimates
+            WHERE data_edited = FALSE AND (pricing_snapshot_id IS NULL OR pricing_snapshot_id <> %s)
+            GROUP BY pricing_snapshot_id, material_quality""",
+            (self.snapshot_id,),
+            fetch=True,
+            primary=True
+        )
+        if groups is None:
+            raise RuntimeError('Failed to read estimates')
+        self.total = sum(group['count'] for group in groups)
+
+        stale = []
+        for group in groups:
+            old_id, quality = group['pricing_snapshot_id'], group['material_quality']
+            old_snapshot = self._old_snapshot(old_id)
+            if old_snapshot is not None:
+                if _plan_signature(old_snapshot, quality) == _plan_signature(snapshot, quality):
+                    self._relink(old_id, quality, group['count'])
+                    continue
+            stale.append((old_id, quality))
+
+        ids = []
+        for old_id, quality in stale:
+            rows = self.db.execute_query(
+                f"""SELECT id FROM estimates
+                WHERE data_edited = FALSE AND pricing_snapshot_id {'= %s' if old_id else 'IS NULL'}
+                AND material_quality {'= %s' if quality is not None else 'IS NULL'}
+                ORDER BY id""",
+                tuple(value for value in (old_id, quality) if value is not None),
+                fetch=True,
+                primary=True
+            )
+            if rows is None:
+                raise RuntimeError('Failed to read estimates')
+            ids.extend(row['id'] for row in rows)
+        ids.sort()
+        return ids
+
+    def _old_snapshot(self, snapshot_id):
+        """Get the catalog of a stored pricing snapshot, or None"""
+        with self._lock:
+            if snapshot_id in self._old_snapshots:
+                return self._old_snapshots[snapshot_id]
+        document = pricing_snapshots.load(snapshot_id) if snapshot_id else None
+        old_snapshot = None
+        if document is not None:
+            old_snapshot = CatalogSnapshot(0, document['materials'], document['consumption_ratios'],
+                                           document['labor_rates'])
+        with self._lock:
+            return self._old_snapshots.setdefault(snapshot_id, old_snapshot)
+
+    def _relink(self, old_id, quality, count):
+        condition = (f"data_edited = FALSE AND pricing_snapshot_id = %s "
+                     f"AND material_quality {'= %s' if quality is not None else 'IS NULL'}")
+        params = tuple(value for value in (old_id, quality) if value is not None)
+
+        with self.db.transaction() as tx:
+            users = tx.execute(
+                f"SELECT DISTINCT user_id FROM estimates WHERE {condition}", params, fetch=True
+            )
+            tx.execute(
+                f"UPDATE estimates SET pricing_snapshot_id = %s WHERE {condition}",
+                (self.snapshot_id,) + params
+            )
+            self._bump_markers(tx, {row['user_id'] for row in users})
+        with self._lock:
+            self.relinked += count
+            self.processed += count
+
+    def _reprice_batch(self, snapshot, ids):
+        document = pricing_snapshots.load(self.snapshot_id)
+        placeholders = ', '.join(['%s'] * len(ids))
+
+        with self.db.transaction() as tx:
+            rows = tx.execute(
+                f"""SELECT id, user_id, plot_length, plot_breadth, num_floors, material_quality,
+                total_cost, cost_per_sqft, created_at, estimate_blob, estimate_data, pricing_snapshot_id
+                FROM estimates WHERE id IN ({placeholders}) AND data_edited = FALSE FOR UPDATE""",
+                tuple(ids),
+                fetch=True
+            )
+
+            # Group by the snapshot and quality each estimate was priced with
+            by_pricing = {}
+            excluded = []
+            for row in rows:
+                old_snapshot = self._old_snapshot(row['pricing_snapshot_id'])
+                if old_snapshot is None or not (row['plot_length'] and row['plot_breadth'] and row['num_floors']):
+                    excluded.append(row['id'])
+                    continue
+                key = (row['pricing_snapshot_id'], row['material_quality'] or 'standard')
+                by_pricing.setdefault(key, (old_snapshot, []))[1].append(row)
+
+            # Keep estimates that still match their old snapshot exactly
+            by_quality = {}
+            for (_, quality), (old_snapshot, group) in by_pricing.items():
+                computed = old_snapshot.cost_plan(quality).estimate_batch(
+                    [float(row['plot_length']) * float(row['plot_breadth']) for row in group],
+                    [row['num_floors'] for row in group]
+                )
+                for row, old_result in zip(group, computed):
+                    estimate_data = self._estimate_data(row)
+                    if _is_calculator_estimate(row, estimate_data, old_result):
+                        by_quality.setdefault(quality, []).append((row, estimate_data))
+                    else:
+                        excluded.append(row['id'])
+
+            updates = []
+            rollup_changes = []
+            users = set()
+            for quality, group in by_quality.items():
+                results = snapshot.cost_plan(quality).estimate_batch(
+                    [float(row['plot_length']) * float(row['plot_breadth']) for row, _ in group],
+                    [row['num_floors'] for row, _ in group]
+                )
+                for (row, estimate_data), result in zip(group, results):
+                    updates.append(self._updated_row(row, estimate_data, result, document))
+                    rollup_changes.append((row, -1))
+                    rollup_changes.append((dict(row, cost_per_sqft=result['cost_per_sqft']), 1))
+                    users.add(row['user_id'])
+
+            if updates:
+                tx.update_many(
+                    'estimates', 'id',
+                    ('total_cost', 'cost_per_sqft', 'estimate_blob', 'estimate_data', 'pricing_snapshot_id'),
+                    updates
+                )
+                cost_rollups.apply(tx, rollup_changes)
+                self._bump_markers(tx, users)
+            if excluded:
+                tx.execute(
+                    f"UPDATE estimates SET data_edited = TRUE WHERE id IN ({', '.join(['%s'] * len(excluded))})",
+                    tuple(excluded)
+                )
+
+        with self._lock:
+            self.batches += 1
+            self.repriced += len(updates)
+            self.skipped += len(excluded) + len(ids) - len(rows)
+            self.processed += len(ids)
+
+    @staticmethod
+    def _bump_markers(tx, users):
+        """Invalidate the owners' estimate list ETags"""
+        tx.execute_many(
+            """INSERT INTO estimate_markers (user_id, version) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1""",
+            [(user_id,) for user_id in users if user_id is not None]
+        )
+
+    @staticmethod
+    def _estimate_data(row):
+        """Decode a row's estimate_data with its snapshot's rates restored"""
+        old_pricing = pricing_snapshots.load(row['pricing_snapshot_id']) if row['pricing_snapshot_id'] else None
+        estimate_data = estimate_codec.decode(row['estimate_blob'], row['estimate_data'])
+        if old_pricing is not None:
+            estimate_data = hydrate_estimate_data(estimate_data, old_pricing)
+        return estimate_data
+
+    def _updated_row(self, row, estimate_data, result, document):
+        estimate_data = dict(estimate_data, **result, pricing_snapshot_id=self.snapshot_id)
+        estimate_data = compact_estimate_data(estimate_data, document)
+
+        return (row['id'], result['total_cost'], result['cost_per_sqft'],
+                estimate_codec.encode(estimate_data), None, self.snapshot_id)
+
+    def status_dict(self):
+        """Get progress and throughput for monitoring"""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                'id': self.id,
+                'status': self.status,
+                'error': self.error,
+                'snapshot_id': self.snapshot_id,
+                'total': self.total,
+                'processed': self.processed,
+                'repriced': self.repriced,
+                'relinked': self.relinked,
+                'skipped': self.skipped,
+                'batches': self.batches,
+                'progress': round(self.processed / self.total, 4) if self.total else (1.0 if self.finished_at else 0.0),
+                'elapsed_seconds': round(elapsed, 3),
+                'estimates_per_second': round(self.processed / elapsed, 1) if elapsed else 0.0
+            }
+
+
+class RepricingRunner:
+    """Run re-pricing jobs one at a time on a background thread
+
+    A request arriving while a job runs is remembered and starts one more
+    job when it finishes, so a burst of price edits costs at most two runs.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self.current = None
+        self.last = None
+
+    def request(self):
+        """Start a job, or queue one behind the job already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._pending = True
+                return self.current
+            return self._start()
+
+    def _start(self):
+        self.current = RepricingJob(self.db)
+        self._thread = threading.Thread(target=self._run, args=(self.current,), daemon=True)
+        self._thread.start()
+        return self.current
+
+    def _run(self, job):
+        job.run()
+        with self._lock:
+            self.last = job
+            if self._pending:
+                self._pending = False
+                self._start()
+
+    def status(self):
+        """Get the running (or last) job's progress"""
+        with self._lock:
+            current, last, pending = self.current, self.last, self._pending
+        return {
+            'current': current.status_dict() if current else None,
+            'last': last.status_dict() if last is not None and last is not current else None,
+            'queued': pending
+        }
+
+
+# Create a global re-pricing runner
+repricing = RepricingRunner(db)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-price saved estimates against the current prices')
+    parser.add_argument('--batch-size', type=int, help='estimates re-priced per transaction')
+    parser.add_argument('--workers', type=int, help='batches re-priced in parallel')
+    args = parser.parse_args(argv)
+
+    job = RepricingJob(db, args.batch_size, args.workers).run()
+    status = job.status_dict()
+    print(f"Re-pricing {status['status']}: {status['repriced']} re-priced, {status['relinked']} relinked, "
+          f"{status['skipped']} skipped in {status['elapsed_seconds']}s "
+          f"({status['estimates_per_second']} estimates/s)")
+    return 0 if job.status == 'completed' else 1
+
+
+if __name__ == '__main__':
+    exit(main())
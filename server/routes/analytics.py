@@ -0,0 +1,59 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from cost_rollups import DEFAULT_PERCENTILES, DIMENSIONS, cost_rollups
+import re
+
+analytics_bp = Blueprint('analytics', __name__)
+
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+@analytics_bp.route('/cost-per-sqft', methods=['GET'])
+@jwt_required()
+def get_cost_per_sqft():
+    """Get average and percentile cost_per_sqft across saved estimates
+
+    Served from the rollup tables, so the cost doesn't grow with the
+    number of estimates. Optional query parameters:
+    - group_by: comma-separated month, material_quality, num_floors
+      (default material_quality; empty for one overall group)
+    - from / to: first and last month, as YYYY-MM
+    - quality, floors: only estimates with this quality / floor count
+    - percentiles: comma-separated, e.g. 50,90,95
+    """
+    try:
+        group_by = request.args.get('group_by', 'material_quality')
+        group_by = tuple(d.strip() for d in group_by.split(',') if d.strip())
+        unknown = [d for d in group_by if d not in DIMENSIONS]
+        if unknown:
+            return jsonify({'error': f'Unknown group_by: {", ".join(unknown)}'}), 400
+
+        filters = {
+            'month_from': request.args.get('from'),
+            'month_to': request.args.get('to'),
+            'material_quality': request.args.get('quality')
+        }
+        for name in ('month_from', 'month_to'):
+            if filters[name] and not MONTH_PATTERN.match(filters[name]):
+                return jsonify({'error': 'from and to must be months as YYYY-MM'}), 400
+
+        try:
+            if 'floors' in request.args:
+                filters['num_floors'] = int(request.args['floors'])
+            percentiles = request.args.get('percentiles')
+            percentiles = (tuple(float(p) for p in percentiles.split(',') if p.strip())
+                           if percentiles else DEFAULT_PERCENTILES)
+        except ValueError:
+            return jsonify({'error': 'floors and percentiles must be numbers'}), 400
+        if not all(0 <= p <= 100 for p in percentiles):
+            return jsonify({'error': 'percentiles must be between 0 and 100'}), 400
+        percentiles = tuple(int(p) if p == int(p) else p for p in percentiles)
+
+        groups = cost_rollups.summary(group_by, filters, percentiles)
+        if groups is None:
+            return jsonify({'error': 'Internal server error'}), 500
+
+        return jsonify({'group_by': list(group_by), 'groups': groups}), 200
+
+    except Exception as e:
+        print(f"Get cost analytics error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
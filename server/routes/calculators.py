@@ -1,8 +1,44 @@
 from flask import Blueprint, request, jsonify
-from database import db
+from pricing_catalog import pricing_catalog
+from pricing_snapshots import pricing_snapshots
+from cost_sweep import axis_size, parse_axis, sweep
+from cost_simulation import simulate
+from result_cache import ResultCache
+from single_flight import SingleFlight
+from price_resolver import get_price_resolver
+import math
+import os
 
 calculators_bp = Blueprint('calculators', __name__)
 
+# Upper bound on scenarios accepted by a single batch request
+BATCH_MAX_SCENARIOS = int(os.getenv('BATCH_MAX_SCENARIOS', 10000))
+
+# Upper bound on grid points (qualities x lengths x breadths x floors) in a sweep
+SWEEP_MAX_POINTS = int(os.getenv('SWEEP_MAX_POINTS', 20000))
+
+# Upper bound on Monte Carlo samples in a simulation request
+SIMULATION_MAX_SAMPLES = int(os.getenv('SIMULATION_MAX_SAMPLES', 2000000))
+
+# Results of the single-item calculators, keyed on normalized inputs and
+# dropped whenever the pricing catalog version changes
+calculator_cache = ResultCache(
+    max_entries=int(os.getenv('CALCULATOR_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('CALCULATOR_CACHE_TTL', 300)),
+    version_source=lambda: pricing_catalog.version
+)
+
+# Concurrent identical calculator requests share one computation
+calculator_flight = SingleFlight()
+
+def _cached(key, compute):
+    """Serve a calculator result from the cache, coalescing concurrent misses"""
+    flight_key = key + (pricing_catalog.version,)
+    return calculator_cache.get_or_compute(
+        key,
+        lambda: calculator_flight.do(flight_key, compute)
+    )
+
 @calculators_bp.route('/construction-cost', methods=['POST'])
 def calculate_construction_cost():
     """Calculate construction cost based on plot dimensions and quality"""
@@ -14,95 +50,176 @@ def calculate_construction_cost():
         num_floors = int(data.get('num_floors', 1))
         quality = data.get('quality', 'standard')
         
-        if length <= 0 or breadth <= 0 or num_floors <= 0:
+        if not (math.isfinite(length) and math.isfinite(breadth)) or \
+                length <= 0 or breadth <= 0 or num_floors <= 0:
             return jsonify({'error': 'Invalid input values'}), 400
         
-        # Calculate total area
-        plot_area = length * breadth
-        total_area = plot_area * num_floors
-        
-        # Get materials and consumption ratios
-        materials = db.execute_query(
-            "SELECT * FROM material_prices WHERE quality = %s",
-            (quality,),
-            fetch=True
-        )
+        # Calculate costs from the compiled plan for this quality level
+        def compute():
+            snapshot = pricing_catalog.snapshot()
+            result = snapshot.cost_plan(quality).estimate(length * breadth, num_floors)
+            # Saving the estimate with this id references these prices, so
+            # store them (once per process) before handing the id out
+            result['pricing_snapshot_id'] = pricing_snapshots.ensure(snapshot)
+            return result
         
-        consumption_ratios = db.execute_query(
-            "SELECT * FROM consumption_ratios",
-            fetch=True
-        )
+        result = _cached(('construction-cost', length, breadth, num_floors, quality), compute)
         
-        labor_rates = db.execute_query(
-            "SELECT * FROM labor_rates",
-            fetch=True
-        )
+        return jsonify(result), 200
         
-        # Calculate material costs
-        material_breakdown = []
-        total_material_cost = 0
+    except Exception as e:
+        print(f"Construction cost calculation error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@calculators_bp.route('/construction-cost/batch', methods=['POST'])
+def calculate_construction_cost_batch():
+    """Calculate construction cost for many scenarios in one request"""
+    try:
+        data = request.get_json()
         
-        for ratio in consumption_ratios:
-            material_name = ratio['material_name']
-            ratio_per_sqft = float(ratio['ratio_per_sqft'])
-            
-            # Find matching material price
-            material_price = next(
-                (m for m in materials if m['material_name'] == material_name),
-                None
-            )
+        scenarios = data.get('scenarios')
+        totals_only = bool(data.get('totals_only', False))
+        
+        if not isinstance(scenarios, list) or not scenarios:
+            return jsonify({'error': 'Scenarios must be a non-empty list'}), 400
+        
+        if len(scenarios) > BATCH_MAX_SCENARIOS:
+            return jsonify({'error': f'At most {BATCH_MAX_SCENARIOS} scenarios are allowed per request'}), 400
+        
+        # Validate scenarios and group them by quality level
+        groups = {}
+        for index, scenario in enumerate(scenarios):
+            try:
+                length = float(scenario.get('length', 0))
+                breadth = float(scenario.get('breadth', 0))
+                num_floors = int(scenario.get('num_floors', 1))
+                quality = scenario.get('quality', 'standard')
+            except (AttributeError, TypeError, ValueError):
+                return jsonify({'error': f'Invalid input values in scenario {index}'}), 400
             
-            if material_price:
-                quantity = ratio_per_sqft * total_area
-                cost = quantity * float(material_price['price'])
-                
-                material_breakdown.append({
-                    'material': material_name,
-                    'quantity': round(quantity, 2),
-                    'unit': ratio['unit'],
-                    'rate': float(material_price['price']),
-                    'cost': round(cost, 2)
-                })
-                
-                total_material_cost += cost
-        
-        # Calculate labor costs (estimate 30% of material cost)
-        labor_breakdown = []
-        total_labor_cost = 0
-        
-        for labor in labor_rates:
-            # Estimate days based on area (rough estimate: 1 worker per 100 sqft)
-            days = max(1, int(total_area / 100))
-            cost = days * float(labor['rate'])
+            if not (math.isfinite(length) and math.isfinite(breadth)) or \
+                    length <= 0 or breadth <= 0 or num_floors <= 0:
+                return jsonify({'error': f'Invalid input values in scenario {index}'}), 400
             
-            labor_breakdown.append({
-                'labor_type': labor['labor_type'],
-                'days': days,
-                'rate': float(labor['rate']),
-                'cost': round(cost, 2)
-            })
-            
-            total_labor_cost += cost
+            group = groups.setdefault(quality, ([], [], []))
+            group[0].append(index)
+            group[1].append(length * breadth)
+            group[2].append(num_floors)
+        
+        # Evaluate each quality group as one vectorized computation
+        catalog = pricing_catalog.snapshot()
+        results = [None] * len(scenarios)
         
-        # Calculate totals
-        total_cost = total_material_cost + total_labor_cost
-        cost_per_sqft = total_cost / total_area if total_area > 0 else 0
+        for quality, (indices, plot_areas, floors) in groups.items():
+            estimates = catalog.cost_plan(quality).estimate_batch(plot_areas, floors, totals_only)
+            for index, estimate in zip(indices, estimates):
+                results[index] = estimate
         
         return jsonify({
-            'plot_area': round(plot_area, 2),
-            'total_area': round(total_area, 2),
-            'num_floors': num_floors,
-            'quality': quality,
-            'material_breakdown': material_breakdown,
-            'labor_breakdown': labor_breakdown,
-            'total_material_cost': round(total_material_cost, 2),
-            'total_labor_cost': round(total_labor_cost, 2),
-            'total_cost': round(total_cost, 2),
-            'cost_per_sqft': round(cost_per_sqft, 2)
+            'count': len(results),
+            'results': results
         }), 200
         
     except Exception as e:
-        print(f"Construction cost calculation error: {e}")
+        print(f"Batch construction cost calculation error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@calculators_bp.route('/construction-cost/sweep', methods=['POST'])
+def calculate_construction_cost_sweep():
+    """Calculate the construction cost surface and price sensitivities over a grid"""
+    try:
+        data = request.get_json()
+        
+        qualities = data.get('quality', 'standard')
+        if not isinstance(qualities, list):
+            qualities = [qualities]
+        qualities = list(dict.fromkeys(qualities))
+        if not qualities or not all(isinstance(q, str) for q in qualities):
+            return jsonify({'error': 'quality must be a string or a list of strings'}), 400
+        
+        perturbations = data.get('price_perturbations') or {}
+        try:
+            perturbations = {name: float(value) for name, value in perturbations.items()}
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'price_perturbations must map material names to numbers'}), 400
+        if not all(math.isfinite(value) for value in perturbations.values()):
+            return jsonify({'error': 'price_perturbations must map material names to numbers'}), 400
+        if any(value <= -1 for value in perturbations.values()):
+            return jsonify({'error': 'Price perturbations must be greater than -1'}), 400
+        
+        # Size the grid before building any axis, so the limit bounds memory
+        axes = (('length', data.get('length'), False),
+                ('breadth', data.get('breadth'), False),
+                ('num_floors', data.get('num_floors', 1), True))
+        try:
+            points = len(qualities)
+            for name, spec, _ in axes:
+                points *= axis_size(spec, name)
+            if points > SWEEP_MAX_POINTS:
+                return jsonify({'error': f'Sweep has {points} points; at most {SWEEP_MAX_POINTS} are allowed'}), 400
+            lengths, breadths, floors = (
+                parse_axis(spec, name, integer=integer, max_points=SWEEP_MAX_POINTS)
+                for name, spec, integer in axes
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            result = sweep(pricing_catalog.snapshot(), lengths, breadths, floors,
+                           qualities, perturbations)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        print(f"Construction cost sweep error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@calculators_bp.route('/construction-cost/simulate', methods=['POST'])
+def simulate_construction_cost():
+    """Run a Monte Carlo cost-risk simulation for a construction estimate"""
+    try:
+        data = request.get_json()
+        
+        try:
+            length = float(data.get('length', 0))
+            breadth = float(data.get('breadth', 0))
+            num_floors = int(data.get('num_floors', 1))
+            samples = int(data.get('samples', 100000))
+            seed = data.get('seed')
+            seed = int(seed) if seed is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid input values'}), 400
+        quality = data.get('quality', 'standard')
+        
+        if not (math.isfinite(length) and math.isfinite(breadth)) or \
+                length <= 0 or breadth <= 0 or num_floors <= 0:
+            return jsonify({'error': 'Invalid input values'}), 400
+        
+        if samples <= 0 or samples > SIMULATION_MAX_SAMPLES:
+            return jsonify({'error': f'samples must be between 1 and {SIMULATION_MAX_SAMPLES}'}), 400
+        
+        if seed is not None and seed < 0:
+            return jsonify({'error': 'seed must be a non-negative integer'}), 400
+        
+        distributions = data.get('distributions')
+        if distributions is not None and not isinstance(distributions, dict):
+            return jsonify({'error': 'distributions must be an object'}), 400
+        
+        plan = pricing_catalog.snapshot().cost_plan(quality)
+        
+        try:
+            result = simulate(plan, length * breadth, num_floors, samples,
+                              seed=seed, distributions=distributions)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result['quality'] = quality
+        return jsonify(result), 200
+        
+    except Exception as e:
+        print(f"Construction cost simulation error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @calculators_bp.route('/concrete-slab', methods=['POST'])
@@ -118,44 +235,12 @@ def calculate_concrete_slab():
         if length <= 0 or breadth <= 0 or thickness <= 0:
             return jsonify({'error': 'Invalid input values'}), 400
         
-        # Calculate volume in cubic meters
-        volume = length * breadth * thickness
-        
-        # Standard concrete mix ratio (1:2:4)
-        cement_bags = volume * 6.5  # bags per cubic meter
-        sand_ton = volume * 0.5  # tons per cubic meter
-        aggregate_ton = volume * 1.0  # tons per cubic meter
-        
-        # Get prices
-        cement = db.execute_query(
-            "SELECT price FROM material_prices WHERE material_name = 'Cement' AND quality = 'standard'",
-            fetch_one=True
+        result = _cached(
+            ('concrete-slab', length, breadth, thickness),
+            lambda: _concrete_slab(length, breadth, thickness)
         )
-        sand = db.execute_query(
-            "SELECT price FROM material_prices WHERE material_name = 'Sand'",
-            fetch_one=True
-        )
-        aggregate = db.execute_query(
-            "SELECT price FROM material_prices WHERE material_name = 'Aggregate'",
-            fetch_one=True
-        )
-        
-        cement_cost = cement_bags * float(cement['price']) if cement else 0
-        sand_cost = sand_ton * float(sand['price']) if sand else 0
-        aggregate_cost = aggregate_ton * float(aggregate['price']) if aggregate else 0
-        
-        total_cost = cement_cost + sand_cost + aggregate_cost
         
-        return jsonify({
-            'volume': round(volume, 2),
-            'cement_bags': round(cement_bags, 2),
-            'sand_ton': round(sand_ton, 2),
-            'aggregate_ton': round(aggregate_ton, 2),
-            'cement_cost': round(cement_cost, 2),
-            'sand_cost': round(sand_cost, 2),
-            'aggregate_cost': round(aggregate_cost, 2),
-            'total_cost': round(total_cost, 2)
-        }), 200
+        return jsonify(result), 200
         
     except Exception as e:
         print(f"Concrete slab calculation error: {e}")
@@ -174,24 +259,12 @@ def calculate_paint():
         if area <= 0 or coats <= 0:
             return jsonify({'error': 'Invalid input values'}), 400
         
-        # Paint coverage: 1 liter covers ~10 sqft per coat
-        liters_needed = (area * coats) / 10
-        
-        # Get paint price
-        paint = db.execute_query(
-            f"SELECT price FROM material_prices WHERE material_name = 'Paint ({paint_type})'",
-            fetch_one=True
+        result = _cached(
+            ('paint', area, coats, paint_type),
+            lambda: _paint(area, coats, paint_type)
         )
         
-        total_cost = liters_needed * float(paint['price']) if paint else 0
-        
-        return jsonify({
-            'area': round(area, 2),
-            'coats': coats,
-            'paint_type': paint_type,
-            'liters_needed': round(liters_needed, 2),
-            'total_cost': round(total_cost, 2)
-        }), 200
+        return jsonify(result), 200
         
     except Exception as e:
         print(f"Paint calculation error: {e}")
@@ -211,32 +284,102 @@ def calculate_bricks():
         if wall_length <= 0 or wall_height <= 0:
             return jsonify({'error': 'Invalid input values'}), 400
         
-        # Calculate wall area
-        wall_area = wall_length * wall_height
-        
-        # Bricks per sqft (for 9" wall)
-        bricks_per_sqft = 8 if wall_thickness >= 0.23 else 4
-        total_bricks = wall_area * bricks_per_sqft
-        
-        # Add 10% wastage
-        total_bricks_with_wastage = total_bricks * 1.1
-        
-        # Get brick price
-        brick = db.execute_query(
-            "SELECT price FROM material_prices WHERE material_name = 'Bricks' AND quality = %s",
-            (quality,),
-            fetch_one=True
+        result = _cached(
+            ('bricks', wall_length, wall_height, wall_thickness, quality),
+            lambda: _bricks(wall_length, wall_height, wall_thickness, quality)
         )
         
-        total_cost = total_bricks_with_wastage * float(brick['price']) if brick else 0
+        return jsonify(result), 200
         
+    except Exception as e:
+        print(f"Bricks calculation error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@calculators_bp.route('/cache/stats', methods=['GET'])
+def get_calculator_cache_stats():
+    """Get calculator result cache and request coalescing statistics"""
+    try:
         return jsonify({
-            'wall_area': round(wall_area, 2),
-            'bricks_needed': round(total_bricks, 0),
-            'bricks_with_wastage': round(total_bricks_with_wastage, 0),
-            'total_cost': round(total_cost, 2)
+            'cache': calculator_cache.stats(),
+            'single_flight': calculator_flight.stats()
         }), 200
         
     except Exception as e:
-        print(f"Bricks calculation error: {e}")
+        print(f"Get calculator cache stats error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
+
+def _concrete_slab(length, breadth, thickness):
+    """Calculate concrete quantities and cost for a slab"""
+    # Calculate volume in cubic meters
+    volume = length * breadth * thickness
+    
+    # Standard concrete mix ratio (1:2:4)
+    cement_bags = volume * 6.5  # bags per cubic meter
+    sand_ton = volume * 0.5  # tons per cubic meter
+    aggregate_ton = volume * 1.0  # tons per cubic meter
+    
+    # Get prices in one round trip
+    cement, sand, aggregate = get_price_resolver().load_many([
+        ('Cement', 'standard'),
+        ('Sand', None),
+        ('Aggregate', None)
+    ])
+    
+    cement_cost = cement_bags * cement if cement else 0
+    sand_cost = sand_ton * sand if sand else 0
+    aggregate_cost = aggregate_ton * aggregate if aggregate else 0
+    
+    total_cost = cement_cost + sand_cost + aggregate_cost
+    
+    return {
+        'volume': round(volume, 2),
+        'cement_bags': round(cement_bags, 2),
+        'sand_ton': round(sand_ton, 2),
+        'aggregate_ton': round(aggregate_ton, 2),
+        'cement_cost': round(cement_cost, 2),
+        'sand_cost': round(sand_cost, 2),
+        'aggregate_cost': round(aggregate_cost, 2),
+        'total_cost': round(total_cost, 2)
+    }
+
+def _paint(area, coats, paint_type):
+    """Calculate paint quantity and cost"""
+    # Paint coverage: 1 liter covers ~10 sqft per coat
+    liters_needed = (area * coats) / 10
+    
+    # Get paint price
+    paint = get_price_resolver().load(f'Paint ({paint_type})')
+    
+    total_cost = liters_needed * paint if paint else 0
+    
+    return {
+        'area': round(area, 2),
+        'coats': coats,
+        'paint_type': paint_type,
+        'liters_needed': round(liters_needed, 2),
+        'total_cost': round(total_cost, 2)
+    }
+
+def _bricks(wall_length, wall_height, wall_thickness, quality):
+    """Calculate brick quantity and cost for a wall"""
+    # Calculate wall area
+    wall_area = wall_length * wall_height
+    
+    # Bricks per sqft (for 9" wall)
+    bricks_per_sqft = 8 if wall_thickness >= 0.23 else 4
+    total_bricks = wall_area * bricks_per_sqft
+    
+    # Add 10% wastage
+    total_bricks_with_wastage = total_bricks * 1.1
+    
+    # Get brick price
+    brick = get_price_resolver().load('Bricks', quality)
+    
+    total_cost = total_bricks_with_wastage * brick if brick else 0
+    
+    return {
+        'wall_area': round(wall_area, 2),
+        'bricks_needed': round(total_bricks, 0),
+        'bricks_with_wastage': round(total_bricks_with_wastage, 0),
+        'total_cost': round(total_cost, 2)
+    }
@@ -1,10 +1,80 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from database import db
+from boq_reports import REPORT_FORMATS, render_report, report_cache
+from cost_rollups import cost_rollups
+from streaming import csv_response, ndjson_response
+from estimate_store import estimate_codec
+from estimate_transfer import (EXPORT_FIELDS, EstimateImportError, EstimateImporter,
+                               export_query, export_rows, parse_csv, parse_ndjson)
+from json_patch import JsonPatchConflict, JsonPatchError, apply_patch, validate_patch
+from pricing_catalog import pricing_catalog
+from pricing_snapshots import compact_estimate_data, hydrate_estimate_data, pricing_snapshots
+from datetime import datetime
+import base64
+import hashlib
+import io
 import json
 
 estimates_bp = Blueprint('estimates', __name__)
 
+# Columns the estimates list can return (?fields=...)
+LIST_FIELDS = (
+    'id', 'project_name', 'plot_length', 'plot_breadth', 'total_area',
+    'num_floors', 'material_quality', 'total_cost', 'cost_per_sqft', 'pricing_snapshot_id',
+    'created_at'
+)
+
+# Columns returned by GET /<id>?data=false, without the estimate_data blob
+SUMMARY_FIELDS = LIST_FIELDS + ('user_id',)
+
+# Largest page the estimates list will return
+MAX_PAGE_SIZE = 200
+
+# Most operations accepted in one PATCH request
+MAX_PATCH_OPERATIONS = 1000
+
+# Bytes read from an import upload at a time
+IMPORT_READ_BUFFER = 64 * 1024
+
+def _bump_estimates_marker(user_id):
+    """Record that a user's estimates changed, invalidating list ETags"""
+    db.execute_query(
+        """INSERT INTO estimate_markers (user_id, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1""",
+        (user_id,)
+    )
+
+def _estimates_marker(user_id):
+    """Get the change counter for a user's estimates"""
+    marker = db.execute_query(
+        "SELECT version FROM estimate_markers WHERE user_id = %s",
+        (user_id,),
+        fetch_one=True
+    )
+    return marker['version'] if marker else 0
+
+def _snapshot_document(snapshot_id):
+    """Get a stored pricing snapshot, or None for estimates without one"""
+    if not snapshot_id:
+        return None
+    document = pricing_snapshots.load(snapshot_id)
+    if document is None:
+        raise RuntimeError(f'Pricing snapshot {snapshot_id} not found')
+    return document
+
+def _encode_cursor(row):
+    created_at = row['created_at']
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    raw = json.dumps([str(created_at), row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, estimate_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return str(created_at), int(estimate_id)
+
 @estimates_bp.route('/', methods=['POST'])
 @jwt_required()
 def save_estimate():
@@ -26,17 +96,36 @@ def save_estimate():
         if not all([plot_length, plot_breadth, total_area, num_floors, total_cost]):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        estimate_id = db.execute_query(
-            """INSERT INTO estimates 
-            (user_id, project_name, plot_length, plot_breadth, total_area, 
-            num_floors, material_quality, total_cost, cost_per_sqft, estimate_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-            (user_id, project_name, plot_length, plot_breadth, total_area,
-             num_floors, material_quality, total_cost, cost_per_sqft, 
-             json.dumps(estimate_data))
-        )
+        # Reference the pricing snapshot the estimate was priced with (the
+        # calculator's pricing_snapshot_id) and keep only the rates that
+        # differ from it. Without one the prices it was computed with are
+        # unknown, so the data is stored whole with no snapshot, as imports
+        # of unknown snapshots are.
+        snapshot_id = data.get('pricing_snapshot_id')
+        if snapshot_id:
+            pricing = pricing_catalog.stored_document(snapshot_id)
+            if pricing is None:
+                return jsonify({'error': 'Unknown pricing snapshot'}), 400
+            estimate_data = compact_estimate_data(estimate_data, pricing)
+        else:
+            snapshot_id = None
+        
+        # Insert and count the estimate in the analytics rollups together
+        with db.transaction() as tx:
+            estimate_id = tx.execute(
+                """INSERT INTO estimates 
+                (user_id, project_name, plot_length, plot_breadth, total_area, 
+                num_floors, material_quality, total_cost, cost_per_sqft, estimate_blob,
+                pricing_snapshot_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                (user_id, project_name, plot_length, plot_breadth, total_area,
+                 num_floors, material_quality, total_cost, cost_per_sqft, 
+                 estimate_codec.encode(estimate_data), snapshot_id)
+            )
+            cost_rollups.add_estimate(tx, estimate_id)
         
         if estimate_id:
+            _bump_estimates_marker(user_id)
             return jsonify({
                 'message': 'Estimate saved successfully',
                 'estimate_id': estimate_id
@@ -51,19 +140,91 @@ def save_estimate():
 @estimates_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_estimates():
-    """Get all estimates for the current user"""
+    """Get estimates for the current user, newest first
+
+    Optional query parameters:
+    - limit / cursor: keyset pagination on (created_at, id); the response
+      carries next_cursor while more pages remain
+    - fields: comma-separated columns to return (id and created_at are
+      always included)
+    - format=ndjson: stream the rows as newline-delimited JSON
+    Responses carry an ETag; If-None-Match gets a 304 until the user's
+    estimates change, decided before any rows are queried.
+    """
     try:
         user_id = get_jwt_identity()
         
-        estimates = db.execute_query(
-            """SELECT id, project_name, plot_length, plot_breadth, total_area,
-            num_floors, material_quality, total_cost, cost_per_sqft, created_at
-            FROM estimates WHERE user_id = %s ORDER BY created_at DESC""",
-            (user_id,),
-            fetch=True
-        )
+        # Field projection
+        fields = request.args.get('fields')
+        if fields:
+            requested = [f.strip() for f in fields.split(',') if f.strip()]
+            unknown = [f for f in requested if f not in LIST_FIELDS]
+            if unknown:
+                return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+            columns = [f for f in LIST_FIELDS if f in requested or f in ('id', 'created_at')]
+        else:
+            columns = list(LIST_FIELDS)
+        
+        # Keyset pagination
+        paginate = 'limit' in request.args or 'cursor' in request.args
+        conditions = ["user_id = %s"]
+        params = [user_id]
+        limit = None
+        
+        if paginate:
+            try:
+                limit = min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE)
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+            if limit <= 0:
+                return jsonify({'error': 'limit must be positive'}), 400
+            
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    created_at, last_id = _decode_cursor(cursor)
+                except (ValueError, TypeError):
+                    return jsonify({'error': 'Invalid cursor'}), 400
+                conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+                params.extend([created_at, created_at, last_id])
+        
+        # Conditional GET on the user's estimates marker
+        fmt = request.args.get('format', 'json')
+        variant = json.dumps([user_id, _estimates_marker(user_id), columns,
+                              limit, request.args.get('cursor'), fmt])
+        etag = hashlib.sha1(variant.encode()).hexdigest()
+        cache_headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+        
+        if etag in request.if_none_match:
+            return '', 304, cache_headers
+        
+        query = (f"SELECT {', '.join(columns)} FROM estimates "
+                 f"WHERE {' AND '.join(conditions)} ORDER BY created_at DESC, id DESC")
+        if paginate:
+            query += " LIMIT %s"
+            params.append(limit + 1)
         
-        return jsonify({'estimates': estimates or []}), 200
+        # Stream the listing row by row for large accounts
+        if fmt == 'ndjson':
+            # HEAD has no body; don't hold a connection for it
+            if request.method == 'HEAD':
+                return ndjson_response([], headers=cache_headers)
+            rows = db.stream_query(query, tuple(params))
+            if rows is None:
+                return jsonify({'error': 'Internal server error'}), 500
+            return ndjson_response(rows, headers=cache_headers)
+        
+        estimates = db.execute_query(query, tuple(params), fetch=True)
+        if estimates is None:
+            return jsonify({'error': 'Internal server error'}), 500
+        
+        body = {'estimates': estimates}
+        if paginate:
+            has_more = len(estimates) > limit
+            body['estimates'] = estimates[:limit]
+            body['next_cursor'] = _encode_cursor(estimates[limit - 1]) if has_more else None
+        
+        return jsonify(body), 200, cache_headers
         
     except Exception as e:
         print(f"Get estimates error: {e}")
@@ -72,12 +233,18 @@ def get_estimates():
 @estimates_bp.route('/<int:estimate_id>', methods=['GET'])
 @jwt_required()
 def get_estimate(estimate_id):
-    """Get a specific estimate"""
+    """Get a specific estimate
+
+    ?data=false returns the summary columns only, without reading or
+    decoding the estimate_data blob.
+    """
     try:
         user_id = get_jwt_identity()
+        include_data = request.args.get('data', 'true').lower() not in ('0', 'false', 'no')
+        columns = '*' if include_data else ', '.join(SUMMARY_FIELDS)
         
         estimate = db.execute_query(
-            "SELECT * FROM estimates WHERE id = %s AND user_id = %s",
+            f"SELECT {columns} FROM estimates WHERE id = %s AND user_id = %s",
             (estimate_id, user_id),
             fetch_one=True
         )
@@ -85,9 +252,12 @@ def get_estimate(estimate_id):
         if not estimate:
             return jsonify({'error': 'Estimate not found'}), 404
         
-        # Parse JSON data
-        if estimate.get('estimate_data'):
-            estimate['estimate_data'] = json.loads(estimate['estimate_data'])
+        # Decompress and parse the estimate data, restoring snapshot rates
+        if include_data:
+            estimate_codec.decode_row(estimate)
+            estimate['estimate_data'] = hydrate_estimate_data(
+                estimate['estimate_data'], _snapshot_document(estimate.get('pricing_snapshot_id'))
+            )
         
         return jsonify({'estimate': estimate}), 200
         
@@ -102,20 +272,28 @@ def delete_estimate(estimate_id):
     try:
         user_id = get_jwt_identity()
         
-        # Check if estimate exists and belongs to user
-        estimate = db.execute_query(
-            "SELECT id FROM estimates WHERE id = %s AND user_id = %s",
-            (estimate_id, user_id),
-            fetch_one=True
-        )
-        
-        if not estimate:
-            return jsonify({'error': 'Estimate not found'}), 404
-        
-        db.execute_query(
-            "DELETE FROM estimates WHERE id = %s",
-            (estimate_id,)
-        )
+        # Delete the estimate and take it out of the analytics rollups together
+        with db.transaction() as tx:
+            estimate = tx.execute(
+                """SELECT created_at, material_quality, num_floors, cost_per_sqft FROM estimates
+                WHERE id = %s AND user_id = %s FOR UPDATE""",
+                (estimate_id, user_id),
+                fetch_one=True
+            )
+            
+            if not estimate:
+                return jsonify({'error': 'Estimate not found'}), 404
+            
+            # Only the request whose DELETE removed the row takes it out of
+            # the rollups; a concurrent duplicate delete gets a 404
+            tx.execute(
+                "DELETE FROM estimates WHERE id = %s AND user_id = %s",
+                (estimate_id, user_id)
+            )
+            if tx.rowcount != 1:
+                return jsonify({'error': 'Estimate not found'}), 404
+            cost_rollups.apply(tx, [(estimate, -1)])
+        _bump_estimates_marker(user_id)
         
         return jsonify({'message': 'Estimate deleted successfully'}), 200
         
@@ -131,38 +309,266 @@ def update_estimate(estimate_id):
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Check if estimate exists and belongs to user
+        if 'project_name' not in data and 'estimate_data' not in data:
+            return jsonify({'error': 'No fields to update'}), 400
+        
+        # Lock the estimate so re-pricing can't move it to another pricing
+        # snapshot between compacting the data and writing it
+        with db.transaction() as tx:
+            estimate = tx.execute(
+                "SELECT id, pricing_snapshot_id FROM estimates WHERE id = %s AND user_id = %s FOR UPDATE",
+                (estimate_id, user_id),
+                fetch_one=True
+            )
+            
+            if not estimate:
+                return jsonify({'error': 'Estimate not found'}), 404
+            
+            # Build update query
+            updates = []
+            params = []
+            
+            if 'project_name' in data:
+                updates.append("project_name = %s")
+                params.append(data['project_name'])
+            
+            if 'estimate_data' in data:
+                # Edited data is no longer calculator output; re-pricing skips it
+                pricing = _snapshot_document(estimate['pricing_snapshot_id'])
+                updates.append("estimate_blob = %s, estimate_data = NULL, data_edited = TRUE")
+                params.append(estimate_codec.encode(
+                    compact_estimate_data(data['estimate_data'], pricing) if pricing else data['estimate_data']
+                ))
+            
+            params.append(estimate_id)
+            tx.execute(f"UPDATE estimates SET {', '.join(updates)} WHERE id = %s", tuple(params))
+        _bump_estimates_marker(user_id)
+        
+        return jsonify({'message': 'Estimate updated successfully'}), 200
+        
+    except Exception as e:
+        print(f"Update estimate error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/<int:estimate_id>', methods=['PATCH'])
+@jwt_required()
+def patch_estimate(estimate_id):
+    """Apply JSON Patch (RFC 6902) operations to an estimate's estimate_data
+
+    The body is a list of operations with paths relative to estimate_data,
+    e.g. [{"op": "replace", "path": "/materials/3/quantity", "value": 12}].
+    The row is read and rewritten in one transaction, locked and matched
+    on both id and owner. A failing "test" operation or a path that does
+    not exist returns 409 and leaves the estimate unchanged, as does an
+    estimate changed by another request while the patch was applied.
+    """
+    try:
+        user_id = get_jwt_identity()
+        operations = request.get_json(force=True, silent=True)
+        
+        try:
+            validate_patch(operations, MAX_PATCH_OPERATIONS)
+        except JsonPatchError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            with db.transaction() as tx:
+                estimate = tx.execute(
+                    """SELECT estimate_blob, estimate_data, pricing_snapshot_id FROM estimates
+                    WHERE id = %s AND user_id = %s FOR UPDATE""",
+                    (estimate_id, user_id),
+                    fetch_one=True
+                )
+                
+                if not estimate:
+                    return jsonify({'error': 'Estimate not found'}), 404
+                
+                # Patch the document as clients see it, with snapshot rates restored
+                pricing = _snapshot_document(estimate['pricing_snapshot_id'])
+                estimate_data = estimate_codec.decode(estimate['estimate_blob'], estimate['estimate_data'])
+                estimate_data = apply_patch(hydrate_estimate_data(estimate_data, pricing), operations)
+                if pricing:
+                    estimate_data = compact_estimate_data(estimate_data, pricing)
+                
+                # Compare-and-swap on the blob that was read, so a concurrent
+                # write is never silently overwritten even without row locks.
+                # An unchanged blob is not written: MySQL counts changed rows.
+                estimate_blob = estimate_codec.encode(estimate_data)
+                if estimate_blob != estimate['estimate_blob']:
+                    tx.execute(
+                        """UPDATE estimates SET estimate_blob = %s, estimate_data = NULL, data_edited = TRUE
+                        WHERE id = %s AND user_id = %s
+                        AND (estimate_blob = %s OR (estimate_blob IS NULL AND %s IS NULL))""",
+                        (estimate_blob, estimate_id, user_id,
+                         estimate['estimate_blob'], estimate['estimate_blob'])
+                    )
+                    if tx.rowcount != 1:
+                        raise JsonPatchConflict('Estimate was changed by another request; retry the patch')
+        except JsonPatchConflict as e:
+            return jsonify({'error': str(e)}), 409
+        
+        _bump_estimates_marker(user_id)
+        
+        return jsonify({'message': 'Estimate updated successfully'}), 200
+        
+    except Exception as e:
+        print(f"Patch estimate error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/<int:estimate_id>/report', methods=['GET'])
+@jwt_required()
+def get_estimate_report(estimate_id):
+    """Download an estimate's bill of quantities as CSV, XLSX or PDF
+
+    ?format=pdf (default), csv or xlsx. The report is rendered as it is
+    streamed and cached on disk by estimate id and the user's estimates
+    marker, so repeat downloads are served from the file until the
+    estimate changes. Responses carry an ETag for conditional GETs.
+    """
+    try:
+        user_id = get_jwt_identity()
+        fmt = request.args.get('format', 'pdf')
+        if fmt not in REPORT_FORMATS:
+            return jsonify({'error': f'format must be one of {", ".join(REPORT_FORMATS)}'}), 400
+        
+        # Read the marker before the estimate, so a cached report is never
+        # older than the marker it is stored under
+        key = report_cache.key(estimate_id, _estimates_marker(user_id))
         estimate = db.execute_query(
             "SELECT id FROM estimates WHERE id = %s AND user_id = %s",
             (estimate_id, user_id),
             fetch_one=True
         )
+        if not estimate:
+            return jsonify({'error': 'Estimate not found'}), 404
+        
+        etag = hashlib.sha1(f'{user_id}:{key}.{fmt}'.encode()).hexdigest()
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': 'private, no-cache',
+            'Content-Disposition': f'attachment; filename="estimate-{estimate_id}.{fmt}"'
+        }
+        if etag in request.if_none_match:
+            return '', 304, headers
+        
+        path = report_cache.get(key, fmt)
+        if path:
+            response = send_file(path, mimetype=REPORT_FORMATS[fmt], etag=False, conditional=False)
+            response.headers.update(headers)
+            return response
         
+        estimate = db.execute_query(
+            "SELECT * FROM estimates WHERE id = %s AND user_id = %s",
+            (estimate_id, user_id),
+            fetch_one=True
+        )
         if not estimate:
             return jsonify({'error': 'Estimate not found'}), 404
+        estimate_codec.decode_row(estimate)
+        estimate['estimate_data'] = hydrate_estimate_data(
+            estimate['estimate_data'], _snapshot_document(estimate.get('pricing_snapshot_id'))
+        )
+        
+        chunks = report_cache.store(key, fmt, render_report(estimate, fmt))
+        return Response(stream_with_context(chunks), headers=headers, mimetype=REPORT_FORMATS[fmt])
+        
+    except Exception as e:
+        print(f"Get estimate report error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/reports/stats', methods=['GET'])
+def get_report_stats():
+    """Get report cache statistics"""
+    try:
+        return jsonify({'reports': report_cache.stats()}), 200
+        
+    except Exception as e:
+        print(f"Get report stats error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_estimates():
+    """Stream all of the current user's estimates, oldest first
+
+    format=ndjson (default) or csv; CSV carries estimate_data as a JSON
+    column. data=false leaves estimate_data out. Rows are read from the
+    database and written to the client one chunk at a time.
+    """
+    try:
+        user_id = get_jwt_identity()
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+        include_data = request.args.get('data', 'true').lower() not in ('0', 'false', 'no')
         
-        # Build update query
-        updates = []
-        params = []
+        headers = {'Content-Disposition': f'attachment; filename="estimates.{fmt}"'}
+        columns = list(EXPORT_FIELDS) + (['estimate_data'] if include_data else [])
         
-        if 'project_name' in data:
-            updates.append("project_name = %s")
-            params.append(data['project_name'])
+        # HEAD has no body; don't hold a connection for it
+        if request.method == 'HEAD':
+            rows = []
+        else:
+            query, params = export_query(user_id, include_data)
+            rows = db.stream_query(query, params)
+            if rows is None:
+                return jsonify({'error': 'Internal server error'}), 500
         
-        if 'estimate_data' in data:
-            updates.append("estimate_data = %s")
-            params.append(json.dumps(data['estimate_data']))
+        records = export_rows(rows, include_data, data_as_text=fmt == 'csv')
+        if fmt == 'csv':
+            response = csv_response(records, columns, headers=headers)
+        else:
+            response = ndjson_response(records, headers=headers)
+        # Closing the unstarted export_rows generator wouldn't reach the rows
+        if hasattr(rows, 'close'):
+            response.call_on_close(rows.close)
+        return response
         
-        if not updates:
-            return jsonify({'error': 'No fields to update'}), 400
+    except Exception as e:
+        print(f"Export estimates error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_estimates():
+    """Bulk import estimates for the current user
+
+    The body is NDJSON (application/x-ndjson) or CSV (text/csv) in the
+    export format, parsed as it is read. The import is all or nothing: an
+    invalid record returns 400 with its line number and stores nothing.
+    """
+    try:
+        user_id = get_jwt_identity()
+        
+        # The raw request stream reads lines a byte at a time
+        body = io.BufferedReader(request.stream, IMPORT_READ_BUFFER)
+        if request.mimetype == 'text/csv':
+            records = parse_csv(body)
+        elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            records = parse_ndjson(body)
+        else:
+            return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
         
-        params.append(estimate_id)
-        query = f"UPDATE estimates SET {', '.join(updates)} WHERE id = %s"
+        try:
+            imported = EstimateImporter(db, user_id).run(records)
+        except EstimateImportError as e:
+            return jsonify({'error': str(e), 'line': e.line}), 400
         
-        db.execute_query(query, tuple(params))
+        return jsonify({
+            'message': 'Estimates imported successfully',
+            'imported': imported
+        }), 201
         
-        return jsonify({'message': 'Estimate updated successfully'}), 200
+    except Exception as e:
+        print(f"Import estimates error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@estimates_bp.route('/storage/stats', methods=['GET'])
+def get_storage_stats():
+    """Get estimate_data compression and decode statistics"""
+    try:
+        return jsonify({'storage': estimate_codec.stats()}), 200
         
     except Exception as e:
-        print(f"Update estimate error: {e}")
+        print(f"Get storage stats error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
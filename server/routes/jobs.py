@@ -0,0 +1,127 @@
+from flask import Blueprint, Response, current_app, request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from jobs import JobQueueFull, PENDING_STATUSES, job_endpoint_allowed, jobs
+import hashlib
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def _job_etag(job):
+    return hashlib.sha1(f"{job['id']}:{job['version']}".encode()).hexdigest()
+
+def _job_body(job):
+    body = dict(job)
+    if job['status'] not in PENDING_STATUSES:
+        body['result_url'] = url_for('jobs.get_job_result', job_id=job['id'])
+    return body
+
+@jobs_bp.route('/', methods=['POST'])
+@jwt_required()
+def submit_job():
+    """Run a slow API request in the background
+
+    The body names the request: {"method": "POST", "path":
+    "/api/calculators/construction-cost/sweep", "body": {...}} with an
+    optional "query" object. Returns 202 with the job id; poll
+    GET /api/jobs/<id> and fetch GET /api/jobs/<id>/result when done.
+    """
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+
+        method = str(data.get('method', 'POST')).upper()
+        path = data.get('path')
+        if not isinstance(path, str) or not job_endpoint_allowed(method, path):
+            return jsonify({'error': 'This request cannot be run as a job'}), 400
+        query = data.get('query')
+        if query is not None and not isinstance(query, dict):
+            return jsonify({'error': 'query must be an object'}), 400
+
+        try:
+            job_id = jobs.submit(current_app._get_current_object(), user_id, method, path,
+                                 data.get('body'), query)
+        except JobQueueFull as e:
+            return jsonify({'error': str(e)}), 429
+
+        status_url = url_for('jobs.get_job', job_id=job_id)
+        return jsonify({
+            'message': 'Job queued',
+            'job_id': job_id,
+            'status_url': status_url
+        }), 202, {'Location': status_url}
+
+    except Exception as e:
+        print(f"Submit job error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@jobs_bp.route('/', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    """Get the current user's recent jobs, newest first"""
+    try:
+        user_id = get_jwt_identity()
+
+        recent = jobs.recent(user_id)
+        if recent is None:
+            return jsonify({'error': 'Internal server error'}), 500
+
+        return jsonify({'jobs': [_job_body(job) for job in recent]}), 200
+
+    except Exception as e:
+        print(f"Get jobs error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Get a job's status
+
+    Responses carry an ETag that changes with every status change, so
+    pollers sending If-None-Match get a 304 until something happens.
+    """
+    try:
+        user_id = get_jwt_identity()
+
+        job = jobs.status(job_id, user_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        etag = _job_etag(job)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+        if job['status'] in PENDING_STATUSES:
+            headers['Retry-After'] = '1'
+        if etag in request.if_none_match:
+            return '', 304, headers
+
+        return jsonify({'job': _job_body(job)}), 200, headers
+
+    except Exception as e:
+        print(f"Get job error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+@jwt_required()
+def get_job_result(job_id):
+    """Get a finished job's response, with the endpoint's status and content type"""
+    try:
+        user_id = get_jwt_identity()
+
+        job = jobs.result(job_id, user_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        if job['status'] in PENDING_STATUSES:
+            return jsonify({'error': 'Job has not finished', 'status': job['status']}), 409
+        if job['result_chunks'] is None:
+            return jsonify({'error': job['error'] or 'Job failed'}), 500
+
+        # A finished job's result never changes
+        etag = _job_etag(job)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, max-age=3600'}
+        if etag in request.if_none_match:
+            return '', 304, headers
+
+        return Response(jobs.iter_result(job['id'], job['result_chunks']), status=job['result_status'],
+                        headers=headers, content_type=job['result_type'])
+
+    except Exception as e:
+        print(f"Get job result error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -1,9 +1,18 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from database import db
+from pricing_catalog import pricing_catalog
+from pricing_snapshots import pricing_snapshots
+from repricing import REPRICE_ON_PRICE_CHANGE, repricing
 
 pricing_bp = Blueprint('pricing', __name__)
 
+def _prices_changed():
+    """Reload the catalog and re-price saved estimates in the background"""
+    pricing_catalog.invalidate()
+    if REPRICE_ON_PRICE_CHANGE:
+        repricing.request()
+
 @pricing_bp.route('/materials', methods=['GET'])
 def get_materials():
     """Get all material prices"""
@@ -86,6 +95,51 @@ def get_consumption_ratios():
         print(f"Get consumption ratios error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@pricing_bp.route('/catalog/stats', methods=['GET'])
+def get_catalog_stats():
+    """Get pricing catalog cache statistics"""
+    try:
+        return jsonify({
+            'catalog': pricing_catalog.stats(),
+            'snapshots': pricing_snapshots.stats()
+        }), 200
+        
+    except Exception as e:
+        print(f"Get catalog stats error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@pricing_bp.route('/snapshots/current', methods=['GET'])
+def get_current_snapshot():
+    """Get the id of the pricing snapshot for the current prices
+
+    Nothing is stored: the snapshot is stored when an estimate references it.
+    """
+    try:
+        return jsonify({'snapshot_id': pricing_catalog.snapshot().snapshot_id}), 200
+        
+    except Exception as e:
+        print(f"Get current snapshot error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@pricing_bp.route('/snapshots/<snapshot_id>', methods=['GET'])
+def get_snapshot(snapshot_id):
+    """Get the prices recorded in a pricing snapshot"""
+    try:
+        document = pricing_catalog.document(snapshot_id)
+        
+        if document is None:
+            return jsonify({'error': 'Pricing snapshot not found'}), 404
+        
+        # Snapshots never change, so clients may cache them indefinitely
+        response = jsonify({'snapshot_id': snapshot_id, 'pricing': document})
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers['ETag'] = f'"{snapshot_id}"'
+        return response, 200
+        
+    except Exception as e:
+        print(f"Get snapshot error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @pricing_bp.route('/materials', methods=['POST'])
 @jwt_required()
 def add_material():
@@ -107,6 +161,7 @@ def add_material():
         )
         
         if material_id:
+            _prices_changed()
             return jsonify({
                 'message': 'Material added successfully',
                 'material_id': material_id
@@ -152,6 +207,7 @@ def update_material(material_id):
         query = f"UPDATE material_prices SET {', '.join(updates)} WHERE id = %s"
         
         db.execute_query(query, tuple(params))
+        _prices_changed()
         
         return jsonify({'message': 'Material updated successfully'}), 200
         
@@ -179,6 +235,7 @@ def add_labor_rate():
         )
         
         if labor_id:
+            _prices_changed()
             return jsonify({
                 'message': 'Labor rate added successfully',
                 'labor_id': labor_id
@@ -189,3 +246,25 @@ def add_labor_rate():
     except Exception as e:
         print(f"Add labor rate error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
+
+@pricing_bp.route('/reprice', methods=['POST'])
+@jwt_required()
+def start_repricing():
+    """Re-price saved estimates against the current prices in the background"""
+    try:
+        job = repricing.request()
+        return jsonify({'message': 'Re-pricing started', 'job': job.status_dict()}), 202
+        
+    except Exception as e:
+        print(f"Start re-pricing error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@pricing_bp.route('/reprice', methods=['GET'])
+def get_repricing_status():
+    """Get re-pricing progress and throughput"""
+    try:
+        return jsonify(repricing.status()), 200
+        
+    except Exception as e:
+        print(f"Get re-pricing status error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
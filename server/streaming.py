@@ -0,0 +1,55 @@
+import csv
+import io
+from flask import Response, current_app, stream_with_context
+
+# Lines buffered into each chunk written to the client
+LINES_PER_CHUNK = 100
+
+
+def _response(body, rows, status, headers, mimetype):
+    response = Response(stream_with_context(body), status=status, headers=headers, mimetype=mimetype)
+    # The body generator may never start (HEAD, client gone), so release
+    # the rows (e.g. a pooled connection) when the response is closed
+    if hasattr(rows, 'close'):
+        response.call_on_close(rows.close)
+    return response
+
+
+def ndjson_response(rows, status=200, headers=None):
+    """Stream an iterable of dicts as newline-delimited JSON.
+
+    Rows are encoded with the app's JSON provider, so values such as
+    Decimal and datetime come out the same as with jsonify. rows.close(),
+    if it has one, is called when the response is closed.
+    """
+    def generate():
+        dumps = current_app.json.dumps
+        lines = []
+        for row in rows:
+            lines.append(dumps(row))
+            if len(lines) >= LINES_PER_CHUNK:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return _response(generate(), rows, status, headers, 'application/x-ndjson')
+
+
+def csv_response(rows, columns, status=200, headers=None):
+    """Stream an iterable of dicts as CSV with a header row of columns"""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(['' if row.get(column) is None else row.get(column) for column in columns])
+            count += 1
+            if count % LINES_PER_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return _response(generate(), rows, status, headers, 'text/csv')
@@ -0,0 +1,57 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time, so point it at a scratch
+# SQLite database before anything imports it
+_db_dir = tempfile.mkdtemp(prefix='estimator-tests-')
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['DB_SQLITE_PATH'] = os.path.join(_db_dir, 'test.db')
+os.environ['REPRICE_ON_PRICE_CHANGE'] = 'false'
+os.environ['SIMULATION_WORKERS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app, db
+    db.init_db()
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    from database import db as database
+    return database
+
+
+@pytest.fixture
+def register(app, client):
+    """Register fresh users: register() returns (user id, Authorization headers)"""
+    from flask_jwt_extended import create_access_token
+
+    def register():
+        username = f'user{next(_users)}'
+        response = client.post('/api/auth/register', json={
+            'username': username, 'email': f'{username}@example.com', 'password': 'secret123'
+        })
+        user_id = response.get_json()['user']['id']
+        with app.app_context():
+            token = create_access_token(identity=str(user_id))
+        return user_id, {'Authorization': f'Bearer {token}'}
+    return register
+
+
+@pytest.fixture
+def auth(register):
+    return register()
@@ -0,0 +1,85 @@
+import threading
+
+
+def _save(client, headers, **fields):
+    estimate = {'plot_length': 30, 'plot_breadth': 40, 'num_floors': 1, 'total_area': 1200,
+                'total_cost': 100000, 'cost_per_sqft': 83, 'estimate_data': {}}
+    estimate.update(fields)
+    response = client.post('/api/estimates/', json=estimate, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['estimate_id']
+
+
+def _run_together(app, count, request):
+    """Send count requests from parallel threads at once; returns the status codes"""
+    barrier = threading.Barrier(count)
+    codes = []
+
+    def send(i):
+        client = app.test_client()
+        barrier.wait()
+        codes.append(request(client, i).status_code)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(codes)
+
+
+def _rollups_match(db):
+    estimates = db.execute_query(
+        "SELECT COUNT(*) AS n, COALESCE(SUM(cost_per_sqft), 0) AS total FROM estimates", fetch_one=True
+    )
+    rollups = db.execute_query(
+        """SELECT COALESCE(SUM(estimate_count), 0) AS n, COALESCE(SUM(cost_per_sqft_sum), 0) AS total
+        FROM estimate_rollups""",
+        fetch_one=True
+    )
+    return int(estimates['n']) == int(rollups['n']) and float(estimates['total']) == float(rollups['total'])
+
+
+def test_duplicate_deletes_keep_rollups_consistent(app, client, db, auth):
+    _, headers = auth
+    for _ in range(10):
+        estimate_id = _save(client, headers)
+        _save(client, headers)
+
+        codes = _run_together(app, 4, lambda c, i: c.delete(f'/api/estimates/{estimate_id}', headers=headers))
+
+        assert codes == [200, 404, 404, 404]
+        assert _rollups_match(db)
+
+
+def test_delete_of_another_users_estimate_is_not_found(client, db, register):
+    _, owner = register()
+    _, intruder = register()
+    estimate_id = _save(client, owner)
+
+    assert client.delete(f'/api/estimates/{estimate_id}', headers=intruder).status_code == 404
+    assert client.get(f'/api/estimates/{estimate_id}', headers=owner).status_code == 200
+    assert _rollups_match(db)
+
+
+def test_concurrent_patches_are_never_lost(app, client, auth):
+    _, headers = auth
+    estimate_id = _save(client, headers, estimate_data={'items': []})
+
+    codes = _run_together(app, 8, lambda c, i: c.patch(
+        f'/api/estimates/{estimate_id}', json=[{'op': 'add', 'path': '/items/-', 'value': i}], headers=headers
+    ))
+
+    items = client.get(f'/api/estimates/{estimate_id}', headers=headers).get_json()['estimate']['estimate_data']['items']
+    assert set(codes) <= {200, 409}
+    assert len(items) == codes.count(200)
+
+
+def test_save_without_snapshot_keeps_full_data(client, auth):
+    _, headers = auth
+    data = {'material_breakdown': [{'material': 'Cement', 'quantity': 1, 'unit': 'bag', 'rate': 350.0, 'cost': 350.0}]}
+    estimate_id = _save(client, headers, estimate_data=data)
+
+    estimate = client.get(f'/api/estimates/{estimate_id}', headers=headers).get_json()['estimate']
+    assert estimate['pricing_snapshot_id'] is None
+    assert estimate['estimate_data'] == data
@@ -0,0 +1,80 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs as jobs_module
+
+SWEEP_JOB = {'method': 'POST', 'path': '/api/calculators/construction-cost/sweep',
+             'body': {'length': [30], 'breadth': [40]}}
+
+
+@pytest.fixture
+def held_jobs(monkeypatch):
+    """Keep submitted jobs queued until the returned event is set"""
+    gate = threading.Event()
+    run = jobs_module.JobRunner._run
+
+    def held_run(self, *args):
+        gate.wait(30)
+        return run(self, *args)
+
+    monkeypatch.setattr(jobs_module.JobRunner, '_run', held_run)
+    yield gate
+    gate.set()
+
+
+def _wait_until_finished(client, headers, job_ids):
+    for _ in range(100):
+        statuses = [client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job']['status']
+                    for job_id in job_ids]
+        if not set(statuses) & set(jobs_module.PENDING_STATUSES):
+            return statuses
+        time.sleep(0.05)
+    raise AssertionError('jobs did not finish')
+
+
+def test_pending_limit_holds_under_concurrent_submits(app, client, db, auth, held_jobs, monkeypatch):
+    user_id, headers = auth
+    monkeypatch.setattr(jobs_module, 'JOB_MAX_PENDING', 3)
+    barrier = threading.Barrier(12)
+    codes = []
+
+    def submit():
+        c = app.test_client()
+        barrier.wait()
+        codes.append(c.post('/api/jobs/', json=SWEEP_JOB, headers=headers).status_code)
+
+    threads = [threading.Thread(target=submit) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(codes) == [202] * 3 + [429] * 9
+    rows = db.execute_query("SELECT id FROM jobs WHERE user_id = %s", (user_id,), fetch=True)
+    assert len(rows) == 3
+
+    held_jobs.set()
+    assert _wait_until_finished(client, headers, [row['id'] for row in rows]) == ['completed'] * 3
+
+
+def test_lost_job_frees_its_slot(client, db, auth, held_jobs, monkeypatch):
+    _, headers = auth
+    monkeypatch.setattr(jobs_module, 'JOB_MAX_PENDING', 1)
+    job_id = client.post('/api/jobs/', json=SWEEP_JOB, headers=headers).get_json()['job_id']
+    assert client.post('/api/jobs/', json=SWEEP_JOB, headers=headers).status_code == 429
+
+    # Its process stopped refreshing the heartbeat
+    db.execute_query("UPDATE jobs SET heartbeat_at = %s WHERE id = %s",
+                     (datetime.now() - timedelta(seconds=jobs_module.JOB_LEASE + 1), job_id))
+
+    response = client.post('/api/jobs/', json=SWEEP_JOB, headers=headers)
+    assert response.status_code == 202
+    job = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job']
+    assert job['status'] == 'failed'
+    assert job['error'] == jobs_module.LOST_ERROR
+
+    held_jobs.set()
+    _wait_until_finished(client, headers, [response.get_json()['job_id']])
@@ -0,0 +1,87 @@
+import pytest
+
+from repricing import RepricingJob
+
+
+def _save_calculated(client, headers, length, breadth, num_floors=2, quality='premium'):
+    """Save the construction-cost calculator's output as an estimate"""
+    result = client.post('/api/calculators/construction-cost', json={
+        'length': length, 'breadth': breadth, 'num_floors': num_floors, 'quality': quality
+    }).get_json()
+    response = client.post('/api/estimates/', json={
+        'plot_length': length, 'plot_breadth': breadth, 'num_floors': num_floors,
+        'total_area': length * breadth * num_floors, 'material_quality': quality,
+        'total_cost': result['total_cost'], 'cost_per_sqft': result['cost_per_sqft'],
+        'pricing_snapshot_id': result['pricing_snapshot_id'], 'estimate_data': result
+    }, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['estimate_id']
+
+
+def _estimate(client, headers, estimate_id):
+    return client.get(f'/api/estimates/{estimate_id}', headers=headers).get_json()['estimate']
+
+
+@pytest.fixture
+def raise_price(client, db, auth):
+    """Change the premium cement price through the API"""
+    def raise_price():
+        material = db.execute_query(
+            "SELECT id, price FROM material_prices WHERE material_name = 'Cement' AND quality = 'premium'",
+            fetch_one=True
+        )
+        response = client.put(f"/api/pricing/materials/{material['id']}",
+                              json={'price': float(material['price']) + 25}, headers=auth[1])
+        assert response.status_code == 200
+    return raise_price
+
+
+def test_patched_estimates_survive_repricing(client, db, auth, raise_price):
+    _, headers = auth
+    unedited = _save_calculated(client, headers, 30, 40)
+    edited_quantity = _save_calculated(client, headers, 31, 40)
+    added_line = _save_calculated(client, headers, 32, 40)
+
+    # Edits that keep the breakdown adding up to the saved totals
+    data = _estimate(client, headers, edited_quantity)['estimate_data']
+    response = client.patch(f'/api/estimates/{edited_quantity}', json=[
+        {'op': 'replace', 'path': '/material_breakdown/0/quantity',
+         'value': data['material_breakdown'][0]['quantity'] + 10},
+    ], headers=headers)
+    assert response.status_code == 200
+    response = client.patch(f'/api/estimates/{added_line}', json=[{'op': 'add', 'path': '/material_breakdown/-', 'value': {
+        'material': 'Paint (Exterior)', 'quantity': 0, 'unit': 'litre', 'rate': 400.0, 'cost': 0.0
+    }}], headers=headers)
+    assert response.status_code == 200
+
+    before = {estimate_id: _estimate(client, headers, estimate_id) for estimate_id in (edited_quantity, added_line)}
+    raise_price()
+    job = RepricingJob(db).run()
+    assert job.status == 'completed'
+
+    for estimate_id, estimate in before.items():
+        assert _estimate(client, headers, estimate_id) == estimate
+
+    repriced = _estimate(client, headers, unedited)
+    current = client.post('/api/calculators/construction-cost', json={
+        'length': 30, 'breadth': 40, 'num_floors': 2, 'quality': 'premium'
+    }).get_json()
+    assert float(repriced['total_cost']) == current['total_cost']
+    assert repriced['estimate_data']['material_breakdown'] == current['material_breakdown']
+    assert repriced['pricing_snapshot_id'] == current['pricing_snapshot_id']
+
+
+def test_skipped_estimates_are_not_scanned_again(client, db, auth, raise_price):
+    _, headers = auth
+    # Saved without a snapshot: the prices it was made with are unknown
+    client.post('/api/estimates/', json={
+        'plot_length': 30, 'plot_breadth': 40, 'num_floors': 2, 'total_area': 2400,
+        'material_quality': 'premium', 'total_cost': 123, 'cost_per_sqft': 1, 'estimate_data': {}
+    }, headers=headers)
+    raise_price()
+
+    first = RepricingJob(db).run()
+    second = RepricingJob(db).run()
+
+    assert first.status == 'completed' and first.skipped >= 1
+    assert second.total == 0